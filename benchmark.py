@@ -0,0 +1,235 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class FakeOllamaServer:
+    # Local stand-in for Ollama's /api/generate with configurable model-side
+    # latency, token rate and streaming chunk size. It keeps track of how much
+    # time it spent "in the model" so the harness can subtract it.
+    def __init__(self, load_ms: float = 0, prompt_eval_ms: float = 50, token_rate: float = 200,
+                 answer_tokens: int = 60, chunk_tokens: int = 1):
+        self.load_ms = load_ms
+        self.prompt_eval_ms = prompt_eval_ms
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.model_seconds = 0.0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reply_for(self, prompt: str) -> list:
+        if "Interpret and convert user input" in prompt:
+            return ["true"]
+        return [f"word{i} " for i in range(self.answer_tokens)]
+
+    def add_model_time(self, seconds: float):
+        with self.lock:
+            self.model_seconds += seconds
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.send_json({"models": []})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with server.lock:
+                    server.requests += 1
+                prompt = body.get("prompt", "")
+                tokens = server.reply_for(prompt)[:body.get("options", {}).get("num_predict", None)]
+                started = time.perf_counter()
+                time.sleep((server.load_ms + server.prompt_eval_ms) / 1000)
+                final = {
+                    "done": True,
+                    "prompt_eval_count": (len(prompt) + 3) // 4,
+                    "eval_count": len(tokens),
+                    "load_duration": int(server.load_ms * 1e6),
+                    "prompt_eval_duration": int(server.prompt_eval_ms * 1e6),
+                }
+
+                if not body.get("stream", True):
+                    time.sleep(len(tokens) / server.token_rate)
+                    elapsed = time.perf_counter() - started
+                    server.add_model_time(elapsed)
+                    final.update(response="".join(tokens), total_duration=int(elapsed * 1e9),
+                                 eval_duration=int(len(tokens) / server.token_rate * 1e9))
+                    self.send_json(final)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i in range(0, len(tokens), server.chunk_tokens):
+                        piece = tokens[i:i + server.chunk_tokens]
+                        time.sleep(len(piece) / server.token_rate)
+                        self.write_chunk({"response": "".join(piece), "done": False})
+                    elapsed = time.perf_counter() - started
+                    final.update(response="", total_duration=int(elapsed * 1e9),
+                                 eval_duration=int(len(tokens) / server.token_rate * 1e9))
+                    self.write_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped early (e.g. after the first command line).
+                    elapsed = time.perf_counter() - started
+                server.add_model_time(elapsed)
+
+            def write_chunk(self, body: dict):
+                data = (json.dumps(body) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+def run_workload(name: str, server: FakeOllamaServer, calls: list) -> dict:
+    latencies, overheads = [], []
+    tracemalloc.start()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for call in calls:
+            model_before = server.model_seconds
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            latencies.append(elapsed * 1000)
+            overheads.append((elapsed - (server.model_seconds - model_before)) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, latencies, overheads, peak)
+
+def summarize(name: str, latencies: list, overheads: list, peak_bytes: int = 0) -> dict:
+    # Imported here: main reads the XDG directories at import time, and
+    # main() redirects them first.
+    from main import percentile
+    return {
+        "workload": name,
+        "runs": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "overhead_p50_ms": round(percentile(overheads, 50), 2) if overheads else None,
+        "peak_python_kb": round(peak_bytes / 1024, 1),
+    }
+
+def measure_startup(iterations: int, env: dict) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, "main.py"), "--startup-time",
+                        "--startup-budget", "1000000"], env=env, stdout=subprocess.DEVNULL, check=True)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize("startup (process)", latencies, [])
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the terminal assistant")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--load-ms', type=float, default=0, help="simulated model load time per request")
+    parser.add_argument('--prompt-eval-ms', type=float, default=50, help="simulated prompt evaluation time")
+    parser.add_argument('--token-rate', type=float, default=200, help="simulated tokens per second")
+    parser.add_argument('--answer-tokens', type=int, default=60, help="tokens in answers and debug suggestions")
+    parser.add_argument('--chunk-tokens', type=int, default=1, help="tokens per streamed chunk")
+    parser.add_argument('--output-mb', type=int, default=50, help="size of the large-output capture workload")
+    parser.add_argument('--max-overhead-ms', type=float, default=None,
+                        help="exit non-zero if any workload's median overhead exceeds this")
+    parser.add_argument('--json', action='store_true', help="print results as JSON lines")
+    args = parser.parse_args()
+
+    # Keep caches, spans, the system profile and the command history away
+    # from the user's real ones; fake translations in history.db would
+    # otherwise be served as examples in real sessions.
+    scratch = tempfile.mkdtemp(prefix="terminal-assistant-bench-")
+    os.environ['XDG_CACHE_HOME'] = os.path.join(scratch, 'cache')
+    os.environ['XDG_DATA_HOME'] = os.path.join(scratch, 'data')
+
+    server = FakeOllamaServer(load_ms=args.load_ms, prompt_eval_ms=args.prompt_eval_ms, token_rate=args.token_rate,
+                              answer_tokens=args.answer_tokens, chunk_tokens=args.chunk_tokens).start()
+    env = dict(os.environ, OLLAMA_HOST=server.url)
+    sys.path.insert(0, BENCH_DIR)
+    import main as assistant_module
+
+    transport = assistant_module.OllamaTransport(base_url=server.url)
+    # config={}: per-role models, candidates or timeouts from the user's
+    # config.json would change the measured workload.
+    assistant = assistant_module.AITerminalAssistant(transport=transport, config={})
+    iterations = range(args.iterations)
+
+    results = [
+        measure_startup(min(args.iterations, 10), env),
+        run_workload("execute_command (translate)", server,
+                     [lambda i=i: assistant.execute_command(f"show me the status of job number {i}") for i in iterations]),
+        run_workload("execute_command (fast path)", server,
+                     [lambda: assistant.execute_command("true") for _ in iterations]),
+        run_workload("answer_question", server,
+                     [lambda i=i: assistant.answer_question(f"what does job {i} do?") for i in iterations]),
+        run_workload("debug_error", server,
+                     [lambda: assistant.debug_error("make", "make: *** No rule to make target 'all'.  Stop.\n" * 50, 2)
+                      for _ in iterations]),
+        run_workload(f"capture {args.output_mb} MB output", server,
+                     [lambda: assistant.execute_command_with_live_output(f"head -c {args.output_mb * 1024 * 1024} /dev/zero")]),
+    ]
+    server.stop()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        print(json.dumps({"max_rss_kb": max_rss_kb, "model_requests": server.requests}))
+    else:
+        print(f"{'Workload':<32} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'overhead':>9} {'peak KB':>9}")
+        for r in results:
+            overhead = f"{r['overhead_p50_ms']:.2f}" if r['overhead_p50_ms'] is not None else "-"
+            print(f"{r['workload']:<32} {r['runs']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                  f"{overhead:>9} {r['peak_python_kb']:>9.1f}")
+        print(f"max RSS: {max_rss_kb / 1024:.1f} MB, model requests: {server.requests}")
+
+    if args.max_overhead_ms is not None:
+        over = [r for r in results if r['overhead_p50_ms'] is not None and r['overhead_p50_ms'] > args.max_overhead_ms]
+        if over:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
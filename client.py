@@ -0,0 +1,254 @@
+import time
+
+STARTUP_STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+from typing import Tuple
+
+from shared import CACHE_DIR, DAEMON_SOCKET, cd_target, change_directory, format_text, reset_format, review_merge
+
+# main.py is deliberately not imported here: the daemon does the heavy
+# lifting and this client only has to start fast.
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+class DaemonClient:
+    # One connection is one daemon session, so conversation context lives as
+    # long as this client does.
+    def __init__(self, path: str = DAEMON_SOCKET, spawn: bool = True, spawn_timeout: float = 30):
+        self.path = path
+        self.spawn = spawn
+        self.spawn_timeout = spawn_timeout
+        self.sock = None
+        self.rfile = None
+        self.debug_pending = False
+
+    def connect(self):
+        try:
+            self.open()
+        except OSError:
+            if not self.spawn:
+                raise
+            self.start_daemon()
+
+    def open(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    def start_daemon(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, 'daemon.log'), 'ab') as log:
+            subprocess.Popen([sys.executable, MAIN_PATH, '--daemon'], stdin=subprocess.DEVNULL, stdout=log,
+                             stderr=log, start_new_session=True, env=dict(os.environ, TERMINAL_ASSISTANT_SOCKET=self.path))
+        deadline = time.monotonic() + self.spawn_timeout
+        while True:
+            try:
+                self.open()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def close(self):
+        if self.sock is not None:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = None
+            self.debug_pending = False
+
+    def request(self, op: str, on_token=None, **fields):
+        if self.sock is None:
+            self.connect()
+        # Commands run in this terminal, so the daemon checks them against our PATH.
+        fields.update(op=op, cwd=os.getcwd(), path=os.environ.get('PATH', os.defpath))
+        try:
+            self.sock.sendall((json.dumps(fields) + "\n").encode())
+            for line in self.rfile:
+                reply = json.loads(line)
+                if "token" in reply:
+                    if on_token:
+                        on_token(reply["token"])
+                    continue
+                if "error" in reply:
+                    raise RuntimeError(reply["error"])
+                return reply["result"]
+        except (OSError, KeyboardInterrupt):
+            # A half-read reply would confuse the next request; start over
+            # with a fresh session instead.
+            self.close()
+            raise
+        self.close()
+        raise ConnectionError("daemon closed the connection")
+
+class TokenPrinter:
+    # Prints a header before the first streamed token, like the in-process REPL.
+    def __init__(self, header: str):
+        self.header = header
+        self.started = False
+
+    def __call__(self, token: str):
+        if not self.started:
+            print(self.header)
+            token = token.lstrip()
+            self.started = True
+        sys.stdout.write(token)
+        sys.stdout.flush()
+
+    def finish(self, result: str):
+        if self.started:
+            print()
+        elif result:
+            print(self.header)
+            print(result)
+
+def run_command(command: str, tail_bytes: int = 16 * 1024) -> Tuple[int, str, float]:
+    # stdout and stdin stay on this terminal; stderr is relayed as it arrives
+    # and its tail kept for the debugger.
+    started = time.perf_counter()
+    process = subprocess.Popen(command, shell=True, stderr=subprocess.PIPE)
+    tail = b""
+    while True:
+        chunk = os.read(process.stderr.fileno(), 65536)
+        if not chunk:
+            break
+        os.write(sys.stderr.fileno(), chunk)
+        tail = (tail + chunk)[-tail_bytes:]
+    process.stderr.close()
+    exit_code = process.wait()
+    return exit_code, tail.decode('utf-8', errors='replace'), round((time.perf_counter() - started) * 1000, 3)
+
+def execute(client: DaemonClient, user_input: str) -> str:
+    if user_input.endswith('?') or user_input.startswith('?'):
+        printer = TokenPrinter(f"{format_text('cyan', bold=True)}Answer:{reset_format()}")
+        printer.finish(client.request("answer", on_token=printer, input=user_input))
+        return ""
+
+    if user_input.lower().strip() == 'clear':
+        os.system('clear')
+        return ""
+
+    if user_input.strip() == ':stats':
+        return client.request("stats")
+
+    if user_input.strip() == ':debug':
+        client.debug_pending = False
+        return client.request("debug", wait=True)["suggestion"] or "No debugging suggestion is pending."
+
+    if user_input.split()[:1] == [':merge']:
+        words = user_input.split(maxsplit=2)
+        if len(words) < 3:
+            return "Usage: :merge FILE FEEDBACK"
+        path = os.path.expanduser(words[1])
+        try:
+            with open(path, 'r', errors='replace') as file:
+                original = file.read()
+            merged = client.request("merge", file=path, feedback=words[2])
+        except (OSError, RuntimeError) as e:
+            return f"{format_text('red')}Merge failed: {e}{reset_format()}"
+        return review_merge(words[1], path, original, merged)
+
+    # ":" followed by a space is the shell's no-op builtin.
+    if user_input.startswith(':') and user_input[1:2].isalpha():
+        return f"Unknown command: {user_input.split()[0]}"
+
+    result = client.request("translate", input=user_input)
+    command = result["command"]
+    if result["destructive"]:
+        confirmation = input(f"{format_text('yellow', bold=True)}Warning: This command may be destructive. Are you sure you want to run '{command}'? (y/n) {reset_format()}")
+        if confirmation.lower() != 'y':
+            return f"{format_text('red', bold=True)}Command execution aborted.{reset_format()}"
+
+    label = "Command" if result["source"] in ("model", "cache") else "Direct Command"
+    print(f"{format_text('white', inverted=True)}{label}: {command}{reset_format()}")
+
+    target = cd_target(command)
+    if target is not None:
+        try:
+            output, exit_code, stderr = change_directory(target), 0, ""
+        except OSError as e:
+            output, exit_code, stderr = "", 1, str(e)
+            print(f"{format_text('red')}{stderr}{reset_format()}")
+        run_ms = 0.0
+    else:
+        output = ""
+        exit_code, stderr, run_ms = run_command(command)
+
+    # Failures are analysed by the daemon in the background, like in main.py.
+    client.request("report", input=user_input, command=command, source=result["source"],
+                   cache_key=result["cache_key"], destructive=result["destructive"], exit_code=exit_code,
+                   stderr=stderr, run_ms=run_ms, background=True)
+    if exit_code != 0:
+        client.debug_pending = True
+        print(f"{format_text('yellow')}Looking into the error in the background; "
+              f"type :debug to wait for the suggestion.{reset_format()}")
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description="Thin client for the terminal assistant daemon (main.py --daemon)")
+    parser.add_argument('--socket', default=DAEMON_SOCKET, help=f"daemon socket (default: {DAEMON_SOCKET})")
+    parser.add_argument('--no-spawn', action='store_true', help="fail instead of starting a daemon if none is running")
+    parser.add_argument('--stop', action='store_true', help="stop the running daemon and exit")
+    parser.add_argument('--startup-time', action='store_true', help="print the time to reach the prompt and exit")
+    args = parser.parse_args()
+
+    import readline  # line editing and history for input()
+
+    client = DaemonClient(args.socket, spawn=not (args.no_spawn or args.stop))
+    try:
+        client.connect()
+        if args.stop:
+            client.request("shutdown")
+            return
+    except OSError as e:
+        print(f"{format_text('red')}Cannot reach the daemon on {args.socket}: {e}{reset_format()}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.startup_time:
+        client.request("ping")
+        print(f"startup: {(time.perf_counter() - STARTUP_STARTED) * 1000:.1f} ms")
+        return
+
+    while True:
+        try:
+            if client.debug_pending:
+                reply = client.request("debug")
+                client.debug_pending = reply["pending"]
+                if reply["suggestion"]:
+                    print(reply["suggestion"])
+
+            user_input = input(f"{format_text('green', bold=True)}{os.getcwd()}$ {reset_format()}")
+            if user_input.lower() == 'exit':
+                break
+            if not user_input.strip():
+                continue
+            target = cd_target(user_input)
+            if target is not None:
+                result = change_directory(target)
+            else:
+                result = execute(client, user_input)
+            if result:
+                print(result)
+        except KeyboardInterrupt:
+            print("\nKeyboardInterrupt")
+        except EOFError:
+            print()
+            break
+        except (OSError, RuntimeError) as e:
+            print(f"{format_text('red')}Error: {e}{reset_format()}")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,1703 @@
+import time
+
+# Taken before the remaining imports so --startup-time includes them.
+STARTUP_STARTED = time.perf_counter()
+
+import argparse
+import copy
 import fcntl
 import getpass
-import glob
+import bisect
+import codecs
+import hashlib
 import json
+import math
+import mmap
 import os
 import pty
-import pyperclip
+import re
+import selectors
 import readline
-import requests
-import select
+import shutil
 import signal
+import socket
+import socketserver
+import sqlite3
 import struct
 import subprocess
 import sys
+import threading
 import termios
 import tty
 import shlex
 
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+
 from typing import List, Tuple
 
-def format_text(fg, bg=None, inverted=False, bold=False):
-    reset = "\033[0m"
-    result = reset
-    if bold:
-        result += "\033[1m"
-    if inverted:
-        result += "\033[7m"
-    fg_codes = {'black': '30', 'red': '31', 'green': '32', 'yellow': '33', 
-                'blue': '34', 'magenta': '35', 'cyan': '36', 'white': '37'}
-    bg_codes = {'black': '40', 'red': '41', 'green': '42', 'yellow': '43', 
-                'blue': '44', 'magenta': '45', 'cyan': '46', 'white': '47'}
-    result += f'\033[{fg_codes.get(fg, "37")}m'
-    if bg:
-        result += f'\033[{bg_codes.get(bg, "40")}m'
-    return result
-
-def reset_format():
-    return "\033[0m"
+from shared import CACHE_DIR, DAEMON_SOCKET, cd_target, change_directory, format_text, reset_format, review_merge
+
+STARTUP_BUDGET_MS = 150
+
+class OllamaTransport:
+    # One pooled keep-alive session shared by every Node, so connection setup
+    # is paid once per process instead of once per call.
+    def __init__(self, base_url: str = None, connect_timeout: float = 3.05, read_timeout: float = 300,
+                 retries: int = 3, backoff: float = 0.5, pool_size: int = 16, keep_alive: str = "30m"):
+        # Imported here so startup does not pay for requests until the first model call.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        base_url = base_url or os.environ.get('OLLAMA_HOST') or 'http://localhost:11434'
+        if "://" not in base_url:
+            base_url = f"http://{base_url}"
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+
+        # Only connection failures and gateway errors are retried; a read
+        # timeout means the model is generating and a retry would redo the work.
+        retry = Retry(total=retries, connect=retries, read=0, status=retries,
+                      backoff_factor=backoff, status_forcelist=[502, 503, 504],
+                      allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, path: str, body: dict, stream: bool = False):
+        if self.keep_alive is not None:
+            body.setdefault("keep_alive", self.keep_alive)
+        return self.session.post(f"{self.base_url}{path}", json=body, stream=stream,
+                                 timeout=(self.connect_timeout, self.read_timeout))
+
+    def close(self):
+        self.session.close()
+
+_shared_transport = None
+
+def get_transport() -> OllamaTransport:
+    global _shared_transport
+    if _shared_transport is None:
+        _shared_transport = OllamaTransport()
+    return _shared_transport
+
+class AsyncCore:
+    # Event loop on a background thread. The REPL stays a plain input() loop
+    # and hands model calls to it, so they can be cancelled, given deadlines
+    # or left running while the user types the next command.
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-core", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine) -> Future:
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        # Blocks the caller; Ctrl-C cancels the coroutine, which closes the
+        # HTTP response and makes Ollama stop generating.
+        future = self.submit(coroutine)
+        try:
+            # Short waits rather than one long one: SIGINT may land on a
+            # worker thread, and the main thread only notices it when it wakes.
+            while not future.done():
+                wait([future], timeout=0.1)
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
+
+_async_core = None
+_async_core_lock = threading.Lock()
+
+def get_async_core() -> AsyncCore:
+    global _async_core
+    with _async_core_lock:
+        if _async_core is None:
+            _async_core = AsyncCore()
+    return _async_core
+
+def percentile(values: List[float], pct: float) -> float:
+    # Nearest rank: the smallest value with at least pct% of the samples at
+    # or below it. Used by :stats and benchmark.py alike.
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered), math.ceil(pct / 100 * len(ordered))) - 1)]
+
+class Telemetry:
+    # Per-Node, per-stage timings and token counts. Every span is appended to
+    # a JSONL file, and the most recent ones are kept in memory for :stats.
+    def __init__(self, path: str = None, window: int = 500, max_file_bytes: int = 10 * 1024 * 1024):
+        self.path = path or os.path.join(CACHE_DIR, 'spans.jsonl')
+        self.window = window
+        self.max_file_bytes = max_file_bytes
+        self.spans = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.file_bytes = 0
+
+    def record(self, node: str, stage: str, duration_ms: float, **fields):
+        span = {"ts": round(time.time(), 3), "node": node, "stage": stage, "duration_ms": round(duration_ms, 3)}
+        span.update(fields)
+        with self.lock:
+            self.spans.setdefault((node, stage), deque(maxlen=self.window)).append(span)
+            self.write(span)
+
+    def write(self, span: dict):
+        # A long-running process reopens the file once it has written past
+        # the limit, so the size check below runs again and rotates it.
+        try:
+            if self.file is not None and self.file_bytes > self.max_file_bytes:
+                self.file.close()
+                self.file = None
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_file_bytes:
+                    os.replace(self.path, self.path + ".1")
+                self.file = open(self.path, 'a', buffering=1)
+                self.file_bytes = self.file.tell()
+            line = json.dumps(span) + "\n"
+            self.file.write(line)
+            self.file_bytes += len(line)
+        except OSError:
+            pass
+
+    def summary(self) -> List[dict]:
+        rows = []
+        with self.lock:
+            items = sorted((key, list(spans)) for key, spans in self.spans.items())
+        for (node, stage), spans in items:
+            durations = [span["duration_ms"] for span in spans]
+            row = {"node": node, "stage": stage, "count": len(spans),
+                   "p50": percentile(durations, 50), "p95": percentile(durations, 95),
+                   "max": max(durations)}
+            for field in ("prompt_tokens", "eval_tokens"):
+                values = [span[field] for span in spans if field in span]
+                if values:
+                    row[field] = sum(values) / len(values)
+            rows.append(row)
+        return rows
+
+    def report(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return "No timings recorded yet."
+        lines = [f"{'Node':<20} {'Stage':<14} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'prompt tok':>10} {'gen tok':>8}"]
+        for row in rows:
+            prompt_tokens = f"{row['prompt_tokens']:.0f}" if "prompt_tokens" in row else "-"
+            eval_tokens = f"{row['eval_tokens']:.0f}" if "eval_tokens" in row else "-"
+            lines.append(f"{row['node']:<20} {row['stage']:<14} {row['count']:>5} {row['p50']:>9.1f} "
+                         f"{row['p95']:>9.1f} {row['max']:>9.1f} {prompt_tokens:>10} {eval_tokens:>8}")
+        return "\n".join(lines)
+
+_shared_telemetry = None
+
+def get_telemetry() -> Telemetry:
+    global _shared_telemetry
+    if _shared_telemetry is None:
+        _shared_telemetry = Telemetry()
+    return _shared_telemetry
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.transport = None
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.healthy = True
+        self.retry_at = 0.0
+
+class EndpointPool:
+    # Spreads requests over several Ollama hosts, picking the healthy one with
+    # the fewest requests in flight. A host that fails a request is taken out
+    # for `cooldown` seconds and must answer a health check before it is used
+    # again; the request itself fails over to the next host.
+    def __init__(self, urls: List[str], cooldown: float = 30, probe_timeout: float = 1.0):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.lock = threading.Lock()
+
+    def transport_for(self, endpoint: Endpoint) -> OllamaTransport:
+        if endpoint.transport is None:
+            # With somewhere to fail over to, don't spend long retrying one host.
+            retries = 1 if len(self.endpoints) > 1 else 3
+            endpoint.transport = OllamaTransport(base_url=endpoint.url, retries=retries)
+        return endpoint.transport
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        transport = self.transport_for(endpoint)
+        try:
+            healthy = transport.session.get(f"{transport.base_url}/api/tags", timeout=self.probe_timeout).ok
+        except Exception:
+            healthy = False
+        if healthy:
+            with self.lock:
+                endpoint.healthy = True
+        else:
+            self.mark_failed(endpoint)
+        return healthy
+
+    def mark_failed(self, endpoint: Endpoint):
+        with self.lock:
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.retry_at = time.time() + self.cooldown
+
+    def acquire(self, exclude: set):
+        now = time.time()
+        with self.lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint not in exclude and (endpoint.healthy or endpoint.retry_at <= now)]
+            candidates.sort(key=lambda endpoint: (not endpoint.healthy, endpoint.outstanding))
+        for endpoint in candidates:
+            if not endpoint.healthy and not self.probe(endpoint):
+                continue
+            with self.lock:
+                endpoint.outstanding += 1
+            return endpoint
+        return None
+
+    def release(self, endpoint: Endpoint):
+        with self.lock:
+            endpoint.outstanding -= 1
+
+    def post(self, path: str, body: dict, stream: bool = False):
+        import requests
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self.acquire(tried)
+            if endpoint is None:
+                raise last_error or requests.ConnectionError("No healthy Ollama endpoint available")
+            tried.add(endpoint)
+            try:
+                response = self.transport_for(endpoint).post(path, dict(body), stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.release(endpoint)
+                self.mark_failed(endpoint)
+                last_error = e
+                continue
+            if response.status_code == 503 and len(tried) < len(self.endpoints):
+                response.close()
+                self.release(endpoint)
+                self.mark_failed(endpoint)
+                continue
+            endpoint.served += 1
+            if not stream:
+                self.release(endpoint)
+                return response
+            # A streamed request stays outstanding until the reader closes it.
+            close = response.close
+            def release_on_close():
+                if not getattr(response, "_pool_released", False):
+                    response._pool_released = True
+                    self.release(endpoint)
+                close()
+            response.close = release_on_close
+            return response
+
+    def status(self) -> List[dict]:
+        with self.lock:
+            return [{"url": endpoint.url, "healthy": endpoint.healthy, "outstanding": endpoint.outstanding,
+                     "served": endpoint.served, "failures": endpoint.failures} for endpoint in self.endpoints]
+
+    def close(self):
+        for endpoint in self.endpoints:
+            if endpoint.transport is not None:
+                endpoint.transport.close()
+
+CONFIG_PATH = os.environ.get('TERMINAL_ASSISTANT_CONFIG') or os.path.join(
+    os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config'), 'terminal-assistant', 'config.json')
+
+def load_config(path: str = None) -> dict:
+    path = path or CONFIG_PATH
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"{format_text('red')}Ignoring config {path}: {str(e)}{reset_format()}")
+        return {}
+
+class ModelRouter:
+    # Maps each Node role (the AITerminalAssistant attribute name, e.g.
+    # "command_executor") to a model and a set of endpoints, from config:
+    #   {"default": {"model": ..., "endpoints": [...]},
+    #    "nodes": {"command_executor": {"model": "llama3.2:3b", "endpoints": [...], "timeout": 60}}}
+    def __init__(self, config: dict, default_model: str, transport=None):
+        default = config.get("default", {})
+        self.nodes = config.get("nodes", {})
+        self.default_model = default.get("model", default_model)
+        self.default_endpoints = default.get("endpoints")
+        self.default_timeout = default.get("timeout")
+        self.transport = transport
+        self.pools = {}
+
+    def model_for(self, role: str) -> str:
+        return self.nodes.get(role, {}).get("model", self.default_model)
+
+    def timeout_for(self, role: str):
+        # Deadline in seconds for a whole call, or None to wait indefinitely.
+        return self.nodes.get(role, {}).get("timeout", self.default_timeout)
+
+    def transport_for(self, role: str):
+        if self.transport is not None:
+            return self.transport
+        endpoints = self.nodes.get(role, {}).get("endpoints") or self.default_endpoints
+        if not endpoints:
+            return None  # the shared default transport
+        key = tuple(endpoints)
+        if key not in self.pools:
+            self.pools[key] = EndpointPool(list(endpoints))
+        return self.pools[key]
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for Llama-style tokenizers; close
+    # enough for budgeting without loading a tokenizer.
+    return (len(text) + 3) // 4
+
+class ContextWindow:
+    # Conversation history for a Node, kept under a token budget by evicting
+    # the oldest turns and optionally folding them into a short summary. The
+    # summary gets at most a quarter of the budget, so it cannot crowd out
+    # the messages themselves.
+    def __init__(self, budget: int = 4096, summarize: bool = True, summary_budget: int = 256):
+        self.budget = budget
+        self.summarize = summarize
+        self.summary_budget = min(summary_budget, budget // 4)
+        self.messages = []
+        self.summary_lines = []
+
+    def append(self, message: dict):
+        message = dict(message)
+        message["tokens"] = estimate_tokens(message["content"])
+        self.messages.append(message)
+        self.trim()
+
+    def summary(self) -> str:
+        if not self.summary_lines:
+            return ""
+        return "Summary of earlier conversation:\n" + "\n".join(self.summary_lines)
+
+    @property
+    def tokens(self) -> int:
+        return sum(msg["tokens"] for msg in self.messages) + estimate_tokens(self.summary())
+
+    def trim(self):
+        while self.messages and self.tokens > self.budget:
+            # Evict a whole user/assistant turn so roles stay paired.
+            turn = self.messages[:2] if len(self.messages) > 1 else self.messages[:1]
+            del self.messages[:len(turn)]
+            if self.summarize:
+                self.fold(turn)
+
+    def fold(self, turn: List[dict]):
+        parts = []
+        for msg in turn:
+            text = " ".join(msg["content"].split())
+            if len(text) > 80:
+                text = text[:77] + "..."
+            parts.append(f"{msg['role']}: {text}")
+        self.summary_lines.append("- " + " -> ".join(parts))
+        while self.summary_lines and estimate_tokens(self.summary()) > self.summary_budget:
+            self.summary_lines.pop(0)
+
+    def __iter__(self):
+        summary = self.summary()
+        if summary:
+            yield {"role": "system", "content": summary}
+        for msg in self.messages:
+            yield msg
+
+    def __len__(self):
+        return len(self.messages)
+
+class CallCancelled(Exception):
+    pass
+
+class TranslationFailed(RuntimeError):
+    # The model call behind a translation returned an error instead of a
+    # command; the message is that error, which must not be run.
+    pass
+
+class CancelScope:
+    # Shared between a Node call running on a worker thread and whoever may
+    # cancel it. Cancelling closes the in-flight response, which drops the
+    # connection and aborts the generation on the Ollama side.
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.response = None
+        self.lock = threading.Lock()
+
+    def attach(self, response):
+        with self.lock:
+            self.response = response
+            if self.cancelled.is_set():
+                response.close()
+                raise CallCancelled()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            if self.response is not None:
+                self.response.close()
 
 class Node:
-    def __init__(self, model_name: str, name: str, max_tokens: int = 8192):
+    def __init__(self, model_name: str, name: str, max_tokens: int = 8192, transport: OllamaTransport = None,
+                 context_budget: int = 4096, timeout: float = None):
         self.model_name = model_name
         self.name = name
+        self.timeout = timeout
         self.definition = ""
-        self.context = []
+        self.context = ContextWindow(budget=context_budget)
         self.max_tokens = max_tokens
-
-    def __call__(self, input_text: str, additional_data: dict = None):
-        try:
-            context_str = "\n".join([f"<|start_header_id|>{msg['role']}<|end_header_id|> {msg['content']}<|eot_id|>" for msg in self.context])
-            
-            prompt = f"""<|start_header_id|>system<|end_header_id|>{self.definition}<|eot_id|>
-{context_str}
+        self._transport = transport
+        self.telemetry = get_telemetry()
+        self.last_prompt_tokens = 0
+
+    def fork(self) -> 'Node':
+        # Same model, definition and transport, but an empty conversation.
+        node = copy.copy(self)
+        context = self.context
+        node.context = ContextWindow(context.budget, context.summarize, context.summary_budget)
+        return node
+
+    @property
+    def transport(self) -> OllamaTransport:
+        if self._transport is None:
+            self._transport = get_transport()
+        return self._transport
+
+    def static_prefix(self) -> str:
+        # Byte-identical across calls so the backend can reuse its prompt
+        # cache. Anything that changes per call must go after it.
+        return f"<|start_header_id|>system<|end_header_id|>{self.definition}<|eot_id|>\n"
+
+    def build_prompt(self, input_text: str, additional_data: dict = None, stateless: bool = False) -> str:
+        # Layout, from most to least stable: static definition, conversation
+        # history (append-only), then the user input and per-call data.
+        history = [] if stateless else self.context
+        context_str = "\n".join([f"<|start_header_id|>{msg['role']}<|end_header_id|> {msg['content']}<|eot_id|>" for msg in history])
+
+        prompt = f"""{self.static_prefix()}{context_str}
 <|start_header_id|>user<|end_header_id|>{input_text}<|eot_id|>"""
 
-            if additional_data:
-                prompt += "\n<|start_header_id|>system<|end_header_id|>Additional data:\n"
-                for key, value in additional_data.items():
-                    prompt += f"{key}: {value}\n"
-                prompt += "<|eot_id|>"
-
-            prompt += "\n<|start_header_id|>assistant<|end_header_id|>"
-
-            response = requests.post('http://localhost:11434/api/generate', 
-                                     json={
-                                         "model": self.model_name,
-                                         "prompt": prompt,
-                                         "stream": False,
-                                         "options": {
-                                             "stop": ["<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>"],
-                                             "num_predict": self.max_tokens
-                                         }
-                                     })
-            
-            if response.status_code == 200:
-                output = response.json()['response'].strip()
-                self.context.append({"role": "user", "content": input_text})
-                self.context.append({"role": "assistant", "content": output})
-                return output
+        if additional_data:
+            prompt += "\n<|start_header_id|>system<|end_header_id|>Additional data:\n"
+            for key, value in additional_data.items():
+                prompt += f"{key}: {value}\n"
+            prompt += "<|eot_id|>"
+
+        prompt += "\n<|start_header_id|>assistant<|end_header_id|>"
+        self.last_prompt_tokens = estimate_tokens(prompt)
+        return prompt
+
+    def request_body(self, prompt: str, stream: bool, options: dict = None) -> dict:
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "stop": ["<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>"],
+                "num_predict": self.max_tokens,
+                **(options or {})
+            }
+        }
+
+    def remember(self, input_text: str, output: str):
+        self.context.append({"role": "user", "content": input_text})
+        self.context.append({"role": "assistant", "content": output})
+
+    def __call__(self, input_text: str, additional_data: dict = None, render: bool = False, first_line: bool = False,
+                 stateless: bool = False, on_token=None, cancel: CancelScope = None, options: dict = None):
+        # render: echo tokens to the terminal as they arrive (or hand them to on_token).
+        # first_line: stop generating as soon as one complete line is available.
+        # stateless: neither read nor extend the conversation history.
+        # cancel: raise CallCancelled and drop the request once it is cancelled.
+        # options: extra Ollama sampling options, e.g. seed and temperature.
+        started = time.perf_counter()
+        stats = {}
+        try:
+            prompt = self.build_prompt(input_text, additional_data, stateless=stateless)
+
+            if render or first_line or on_token or cancel:
+                response = self.transport.post('/api/generate', self.request_body(prompt, True, options), stream=True)
+                if cancel:
+                    cancel.attach(response)
+                if response.status_code != 200:
+                    try:
+                        return self.report_error(f"Error in Ollama API call: {response.status_code} - {response.text}",
+                                                 render)
+                    finally:
+                        # An EndpointPool only frees the endpoint's slot once the response is closed.
+                        response.close()
+                output = self.read_stream(response, render=render, first_line=first_line, stats=stats,
+                                          started=started, on_token=on_token, cancel=cancel)
             else:
-                return f"Error in Ollama API call: {response.status_code} - {response.text}"
+                response = self.transport.post('/api/generate', self.request_body(prompt, False, options))
+                if response.status_code != 200:
+                    try:
+                        return f"Error in Ollama API call: {response.status_code} - {response.text}"
+                    finally:
+                        response.close()
+                stats = response.json()
+                output = stats['response'].strip()
+
+            self.record_call(started, stats, prompt)
+
+            if not stateless:
+                self.remember(input_text, output)
+            return output
         except Exception as e:
-            return f"Error in processing: {str(e)}"
+            if cancel and cancel.cancelled.is_set():
+                self.telemetry.record(self.name, "cancelled", (time.perf_counter() - started) * 1000)
+                raise CallCancelled() from e
+            return self.report_error(f"Error in processing: {str(e)}", render)
+
+    def warm_up(self):
+        # Load the model and evaluate the static prefix so the first real
+        # call only pays for its own suffix.
+        started = time.perf_counter()
+        body = self.request_body(self.static_prefix(), False)
+        body["options"]["num_predict"] = 1
+        try:
+            response = self.transport.post('/api/generate', body)
+            response.close()
+            self.telemetry.record(self.name, "warm_up", (time.perf_counter() - started) * 1000,
+                                  status=response.status_code)
+        except Exception:
+            pass
+
+    async def acall(self, input_text: str, additional_data: dict = None, render: bool = False, first_line: bool = False,
+                    stateless: bool = False, on_token=None, timeout: float = None, options: dict = None):
+        # Cancelling the awaiting task (or missing the deadline) cancels the
+        # request itself, not just the wait for it.
+        import asyncio
+        timeout = self.timeout if timeout is None else timeout
+        cancel = CancelScope()
+        call = asyncio.to_thread(self, input_text, additional_data, render, first_line, stateless, on_token, cancel,
+                                 options)
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            cancel.cancel()
+            return self.report_error(f"Error in processing: no answer from {self.name} within {timeout:g}s", render)
+        except asyncio.CancelledError:
+            cancel.cancel()
+            raise
+
+    @staticmethod
+    def report_error(message: str, render: bool) -> str:
+        if render:
+            print(f"{format_text('red')}{message}{reset_format()}")
+        return message
+
+    def record_call(self, started: float, stats: dict, prompt: str):
+        # Ollama reports durations in nanoseconds on the final response; an
+        # early-stopped stream has none, so fall back to our own estimate.
+        request_ms = (time.perf_counter() - started) * 1000
+        prompt_tokens = stats.get('prompt_eval_count', estimate_tokens(prompt))
+        fields = {"prompt_tokens": prompt_tokens, "early_stop": not stats.get('done', False)}
+        if 'eval_count' in stats:
+            fields["eval_tokens"] = stats['eval_count']
+        self.telemetry.record(self.name, "request", request_ms, **fields)
+        if 'first_token_ms' in stats:
+            self.telemetry.record(self.name, "first_token", stats['first_token_ms'])
+        for key, stage in (('load_duration', 'load'), ('prompt_eval_duration', 'prompt_eval'),
+                           ('eval_duration', 'generation')):
+            if key in stats:
+                self.telemetry.record(self.name, stage, stats[key] / 1e6)
+
+    def read_stream(self, response, render: bool = False, first_line: bool = False, stats: dict = None,
+                    started: float = None, on_token=None, cancel: CancelScope = None) -> str:
+        chunks = []
+        request_started = time.perf_counter() if started is None else started
+        started = False
+        stats = {} if stats is None else stats
+        try:
+            for line in response.iter_lines():
+                if cancel and cancel.cancelled.is_set():
+                    raise CallCancelled()
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get('error'):
+                    raise RuntimeError(data['error'])
+                token = data.get('response', '')
+                if token:
+                    if 'first_token_ms' not in stats:
+                        stats['first_token_ms'] = (time.perf_counter() - request_started) * 1000
+                    if not started:
+                        token = token.lstrip()
+                        started = bool(token)
+                    chunks.append(token)
+                    if on_token and token:
+                        on_token(token)
+                    elif render and token:
+                        sys.stdout.write(token)
+                        sys.stdout.flush()
+                    if first_line and self.first_complete_line(''.join(chunks)) is not None:
+                        break
+                if data.get('done'):
+                    stats.update(data)
+                    break
+        finally:
+            # Closing the response drops the connection, which makes Ollama
+            # abort the rest of the generation when we stop early.
+            response.close()
+            if render and started and on_token is None:
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+
+        output = ''.join(chunks).strip()
+        if first_line:
+            line = self.first_complete_line(output + "\n")
+            return line if line is not None else output
+        return output
+
+    @staticmethod
+    def first_complete_line(text: str):
+        lines = text.split("\n")
+        for line in lines[:-1]:
+            line = line.strip()
+            if line and not line.startswith("```"):
+                return line
+        return None
+
+class TranslationCache:
+    # On-disk map from (model, normalized input, context fingerprint) to the
+    # translated command. SQLite in WAL mode lets several terminals share it.
+    def __init__(self, path: str = None, max_entries: int = 2000, ttl: float = 7 * 24 * 3600):
+        self.path = path or os.path.join(CACHE_DIR, 'translations.db')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        # One connection is shared by all threads (batch mode), so serialize use.
+        self.lock = threading.RLock()
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY, command TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations(last_used)")
+            self.conn = conn
+        return self.conn
+
+    @staticmethod
+    def make_key(model_name: str, user_input: str, cwd: str, additional_data: dict = None) -> str:
+        normalized = " ".join(user_input.lower().split())
+        # The working directory only matters when the input names something in it.
+        words = user_input.split()
+        relevant_cwd = cwd if additional_data or any(os.path.exists(os.path.join(cwd, w)) for w in words) else ""
+        fingerprint = json.dumps(additional_data or {}, sort_keys=True, default=str)
+        return hashlib.sha256("\0".join([model_name, normalized, relevant_cwd, fingerprint]).encode()).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            return self.locked_get(key)
+
+    def locked_get(self, key: str):
+        try:
+            conn = self.connect()
+            now = time.time()
+            row = conn.execute("SELECT command, created FROM translations WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+            if row:
+                conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+        self.misses += 1
+        return None
+
+    def put(self, key: str, command: str, cwd: str = None):
+        # A command that spells out the directory it was translated in (the
+        # prompt includes it) would run against that directory from anywhere,
+        # and the key only includes the cwd some of the time, so it is not kept.
+        if cwd and cwd != os.sep and cwd.rstrip(os.sep) in command:
+            return
+        with self.lock:
+            self.locked_put(key, command)
+
+    def locked_put(self, key: str, command: str):
+        try:
+            conn = self.connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO translations (key, command, created, last_used) VALUES (?, ?, ?, ?)",
+                             (key, command, now, now))
+                conn.execute("DELETE FROM translations WHERE created < ?", (now - self.ttl,))
+                conn.execute("""DELETE FROM translations WHERE key IN (
+                    SELECT key FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        try:
+            with self.lock:
+                entries = self.connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        except sqlite3.Error:
+            entries = 0
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+SHELL_BUILTINS = {
+    'alias', 'bg', 'bind', 'break', 'builtin', 'caller', 'cd', 'command', 'compgen', 'complete', 'continue',
+    'declare', 'dirs', 'disown', 'echo', 'enable', 'eval', 'exec', 'exit', 'export', 'false', 'fc', 'fg',
+    'getopts', 'hash', 'help', 'history', 'jobs', 'kill', 'let', 'local', 'logout', 'popd', 'printf', 'pushd',
+    'pwd', 'read', 'readonly', 'return', 'set', 'shift', 'shopt', 'source', 'test', 'times', 'trap', 'true',
+    'type', 'typeset', 'ulimit', 'umask', 'unalias', 'unset', 'wait', '.', '[', 'for', 'if', 'while', 'until',
+    'case', 'time',
+}
+
+# Programs whose operands are all existing files, so a missing one means the
+# command cannot work.
+FILE_PROGRAMS = {'cat', 'tac', 'less', 'more', 'nl', 'wc', 'source', '.', 'stat', 'file', 'md5sum', 'sha1sum',
+                 'sha256sum', 'xxd', 'strings'}
+
+# Programs driven by subcommands and names (git status, apt install vim), whose
+# bare-word arguments are normal rather than a sign of prose.
+SUBCOMMAND_PROGRAMS = {'git', 'docker', 'podman', 'kubectl', 'apt', 'apt-get', 'apt-cache', 'dnf', 'yum', 'pacman',
+                       'zypper', 'brew', 'snap', 'flatpak', 'systemctl', 'service', 'pip', 'pip3', 'npm', 'yarn',
+                       'cargo', 'go', 'make', 'ip', 'nmcli', 'conda', 'gh', 'tmux'}
+
+SHELL_KEYWORDS = {'then', 'else', 'elif', 'fi', 'do', 'done', 'esac', 'in', 'function', 'select', '[[', ']]'}
+
+DESTRUCTIVE_COMMANDS = {'rm', 'rmdir', 'dd', 'mkfs', 'shred', 'wipefs', 'fdisk', 'parted', 'truncate', 'chown', 'chmod'}
+
+class ShellClassifier:
+    # Decides locally whether input is already a shell command, so it can skip
+    # the model entirely. It errs towards "no": a false negative only costs a
+    # model call, a false positive runs the wrong thing.
+    natural_words = {
+        'a', 'an', 'the', 'all', 'any', 'every', 'my', 'me', 'i', 'in', 'of', 'for', 'to', 'with', 'from',
+        'that', 'this', 'these', 'those', 'what', 'which', 'how', 'is', 'are', 'please', 'show', 'files',
+        'file', 'folder', 'folders', 'directory', 'directories', 'and', 'or', 'it', 'them', 'some', 'biggest',
+        'largest', 'smallest', 'newest', 'oldest', 'recent', 'called', 'named', 'containing', 'inside',
+    }
+    shell_markers = set('|&;<>$`*=/~-."\'')
+
+    def __init__(self):
+        self.aliases = None
+        self.checked = 0
+        self.fast_path_hits = 0
+
+    def load_aliases(self) -> dict:
+        # Read alias definitions straight from the rc files; starting an
+        # interactive shell to ask it would cost more than the model call.
+        if self.aliases is None:
+            self.aliases = {}
+            for rc_file in ['~/.bashrc', '~/.bash_aliases', '~/.zshrc', '~/.aliases']:
+                try:
+                    with open(os.path.expanduser(rc_file), 'r', errors='replace') as file:
+                        for line in file:
+                            line = line.strip()
+                            if line.startswith('alias ') and '=' in line:
+                                name, value = line[6:].split('=', 1)
+                                try:
+                                    value = shlex.split(value)[0]
+                                except (ValueError, IndexError):
+                                    continue
+                                self.aliases[name.strip()] = value
+                except OSError:
+                    pass
+        return self.aliases
+
+    def resolves(self, word: str, search_path: str = None) -> bool:
+        # search_path: the PATH to look programs up in; None means ours.
+        return (word in SHELL_BUILTINS or shutil.which(word, path=search_path) is not None
+                or word in self.load_aliases())
+
+    def syntax_ok(self, command: str) -> bool:
+        try:
+            return subprocess.run(['bash', '-n', '-c', command], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL, timeout=2).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    def looks_like_prose(self, program: str, args: List[str], cwd: str = "") -> bool:
+        # A bare word (letters only, not an existing path) reads as English
+        # for most programs: "watch disk space", "kill firefox". Only
+        # subcommand-style programs may take them, unless they are common
+        # English words.
+        for arg in args:
+            if any(ch in self.shell_markers for ch in arg) or os.path.exists(os.path.join(cwd, arg)):
+                continue
+            if arg.lower().strip(',.!') in self.natural_words:
+                return True
+            if arg.isalpha() and program not in SUBCOMMAND_PROGRAMS:
+                return True
+        return False
+
+    def is_shell_command(self, text: str, cwd: str = "", search_path: str = None) -> bool:
+        self.checked += 1
+        try:
+            tokens = self.shell_tokens(text, posix=True)
+        except ValueError:
+            return False
+        if not tokens:
+            return False
+        # Every command in a list or pipeline has to look like one; bash -n
+        # below rejects operators with nothing around them.
+        segment = []
+        for token in tokens + [';']:
+            if not (token and all(ch in '|&;()' for ch in token)):
+                segment.append(token)
+                continue
+            while segment and ('=' in segment[0] and not segment[0].startswith('=')):
+                segment = segment[1:]
+            if segment and segment[0] == 'sudo':
+                segment = segment[1:]
+            if not segment:
+                continue
+            if not self.resolves(segment[0], search_path):
+                return False
+            if self.looks_like_prose(os.path.basename(segment[0]), segment[1:], cwd):
+                return False
+            segment = []
+        if not self.syntax_ok(text):
+            return False
+        self.fast_path_hits += 1
+        return True
+
+    def validate(self, command: str, cwd: str = "", search_path: str = None) -> str:
+        # Cheap local checks on a generated command: syntax, that every
+        # program in it resolves, and that path arguments exist (or, for
+        # files it may create, that their directory does). Returns what is
+        # wrong, or "" if nothing is.
+        if command.startswith("CONFIRM:"):
+            command = command[8:].strip()
+        if not command:
+            return "empty command"
+        if not self.syntax_ok(command):
+            return "syntax error"
+        # Non-POSIX mode keeps the quotes, so quoted patterns (sed, grep,
+        # awk) can be told apart from paths.
+        try:
+            tokens = self.shell_tokens(command)
+        except ValueError:
+            return "unbalanced quotes"
+
+        expect_program = True
+        program = None
+        redirect = None
+        for token in tokens:
+            if all(ch in '|&;()' for ch in token):
+                expect_program = True
+                continue
+            if all(ch in '<>&' for ch in token):
+                redirect = token
+                continue
+            if redirect is not None:
+                problem = self.check_path(token, cwd, must_exist=redirect == '<', explicit=True)
+                redirect = None
+                if problem:
+                    return problem
+                continue
+            if expect_program:
+                if '=' in token and not token.startswith('='):
+                    continue
+                if token in ('sudo', 'env', 'nohup', 'nice', 'exec', 'command', '!', '{', '}') or token in SHELL_KEYWORDS:
+                    continue
+                expect_program = False
+                program = os.path.basename(token)
+                if '/' in token:
+                    if not os.access(os.path.join(cwd, os.path.expanduser(token)), os.X_OK):
+                        return f"{token}: not an executable"
+                elif not self.resolves(token, search_path):
+                    return f"{token}: command not found"
+                continue
+            if program == 'mkdir':
+                continue  # mkdir -p creates whole trees
+            problem = self.check_path(token, cwd, must_exist=program in FILE_PROGRAMS,
+                                      explicit=program in FILE_PROGRAMS)
+            if problem:
+                return problem
+        return ""
+
+    @staticmethod
+    def check_path(token: str, cwd: str, must_exist: bool = False, explicit: bool = False) -> str:
+        # explicit: the token is known to be a file (a redirect target or an
+        # operand of a FILE_PROGRAMS command). Otherwise only words that are
+        # unmistakably paths (/..., ./..., ../..., ~...) are checked, so things
+        # like origin/main or +%Y/%m/%d are left alone. Quoted words, anything
+        # the shell would still expand, options, numbers and URLs are skipped.
+        if token[0] in '-+\'"' or token.isdigit() or '://' in token or any(ch in token for ch in '$`*?[{='):
+            return ""
+        if not explicit and not token.startswith(('/', './', '../', '~')):
+            return ""
+        path = os.path.join(cwd, os.path.expanduser(token))
+        if os.path.exists(path):
+            return ""
+        if not must_exist and os.path.isdir(os.path.dirname(path.rstrip('/')) or '.'):
+            return ""
+        return f"{token}: no such file or directory"
+
+    def expand_alias(self, command: str, search_path: str = None) -> str:
+        # Commands run under a non-interactive shell, which does not expand aliases.
+        first, _, rest = command.strip().partition(" ")
+        aliases = self.load_aliases()
+        if first in aliases and shutil.which(first, path=search_path) is None and first not in SHELL_BUILTINS:
+            return f"{aliases[first]} {rest}".strip()
+        return command
+
+    @staticmethod
+    def shell_tokens(command: str, posix: bool = False) -> List[str]:
+        # Words with the control operators (|, &&, ;, parentheses,
+        # redirections) split out as tokens of their own.
+        lexer = shlex.shlex(command, posix=posix, punctuation_chars=True)
+        lexer.whitespace_split = True
+        return list(lexer)
+
+    @classmethod
+    def is_destructive(cls, command: str) -> bool:
+        # Looks at every simple command in a list or pipeline, including the
+        # programs run by sudo, xargs and find -exec, and at find -delete.
+        try:
+            tokens = cls.shell_tokens(command, posix=True)
+        except ValueError:
+            return True
+        segment = []
+        for token in tokens + [';']:
+            if token and all(ch in '|&;()' for ch in token):
+                if cls.segment_is_destructive(segment):
+                    return True
+                segment = []
+            else:
+                segment.append(token)
+        return False
+
+    @staticmethod
+    def segment_is_destructive(words: List[str]) -> bool:
+        while words and '=' in words[0] and not words[0].startswith('='):
+            words = words[1:]
+        if not words:
+            return False
+        names = [os.path.basename(word) for word in words]
+        if names[0] in DESTRUCTIVE_COMMANDS:
+            return True
+        if names[0] in ('sudo', 'doas', 'xargs', 'env', 'nohup', 'nice', 'time', 'timeout', 'exec', 'command',
+                        'watch', 'parallel'):
+            # Their options vary too much to find the wrapped program
+            # reliably, so any destructive name among the arguments counts.
+            return any(name in DESTRUCTIVE_COMMANDS for name in names[1:])
+        if names[0] == 'find':
+            if '-delete' in words:
+                return True
+            for index, word in enumerate(words[:-1]):
+                if word in ('-exec', '-execdir', '-ok', '-okdir') and names[index + 1] in DESTRUCTIVE_COMMANDS:
+                    return True
+        return False
+
+class StreamCapture:
+    # Keeps only the first head_bytes and the last tail_bytes of a stream, so
+    # memory stays flat however much a command prints.
+    def __init__(self, head_bytes: int, tail_bytes: int):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.lines = 0
+
+    def feed(self, data: bytes):
+        self.total_bytes += len(data)
+        self.lines += data.count(b"\n")
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.tail_bytes
+            if excess > 0:
+                del self.tail[:excess]
+
+    @property
+    def dropped_bytes(self) -> int:
+        return self.total_bytes - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        head = self.head.decode('utf-8', errors='replace')
+        if not self.dropped_bytes:
+            return head + self.tail.decode('utf-8', errors='replace')
+        # The tail may start in the middle of a multi-byte character.
+        tail = bytes(self.tail)
+        while tail and tail[0] & 0xC0 == 0x80:
+            tail = tail[1:]
+        marker = f"\n[... {self.dropped_bytes} bytes omitted ...]\n"
+        return head + marker + tail.decode('utf-8', errors='replace')
+
+class CaptureEngine:
+    # Relays a child's stdout/stderr pipes to the terminal with a selector
+    # (epoll on Linux) and keeps a bounded copy of each stream. stdout bytes
+    # are written through untouched; stderr is decoded incrementally so the
+    # red colour codes never land in the middle of a multi-byte character.
+    chunk_size = 64 * 1024
+
+    def __init__(self, head_bytes: int = 64 * 1024, tail_bytes: int = 256 * 1024, out_fd: int = None):
+        self.stdout = StreamCapture(head_bytes, tail_bytes)
+        self.stderr = StreamCapture(head_bytes, tail_bytes)
+        self.out_fd = out_fd
+        self.stderr_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.selector = selectors.DefaultSelector()
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.out_fd, view)
+            view = view[written:]
+
+    def run(self, process):
+        if self.out_fd is None:
+            sys.stdout.flush()
+            self.out_fd = sys.stdout.fileno()
+        self.selector.register(process.stdout, selectors.EVENT_READ, self.stdout)
+        self.selector.register(process.stderr, selectors.EVENT_READ, self.stderr)
+
+        while self.selector.get_map():
+            events = self.selector.select(timeout=0.25)
+            if not events and process.poll() is not None:
+                # The command exited but a background child still holds the pipes.
+                break
+            for key, _ in events:
+                data = os.read(key.fd, self.chunk_size)
+                if not data:
+                    self.selector.unregister(key.fileobj)
+                    continue
+                key.data.feed(data)
+                if key.data is self.stdout:
+                    self.write(data)
+                else:
+                    self.write_stderr(self.stderr_decoder.decode(data))
+        self.write_stderr(self.stderr_decoder.decode(b"", final=True))
+
+    def write_stderr(self, text: str):
+        if text:
+            self.write(f"{format_text('red')}{text}{reset_format()}".encode())
+
+    def stats(self) -> dict:
+        return {
+            "stdout_bytes": self.stdout.total_bytes,
+            "stdout_lines": self.stdout.lines,
+            "stderr_bytes": self.stderr.total_bytes,
+            "stderr_lines": self.stderr.lines,
+        }
+
+    def close(self):
+        self.selector.close()
+
+class PtyRelay:
+    # Multiplexes the pty master and our stdin in one selector loop. Bytes are
+    # passed through untouched in large chunks, and terminal resizes are
+    # forwarded to the child via SIGWINCH.
+    chunk_size = 64 * 1024
+
+    def __init__(self, master_fd: int, in_fd: int = None, out_fd: int = None):
+        self.master_fd = master_fd
+        self.in_fd = sys.stdin.fileno() if in_fd is None else in_fd
+        self.out_fd = sys.stdout.fileno() if out_fd is None else out_fd
+
+    @staticmethod
+    def write_all(fd: int, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    def send_eof(self):
+        # Our input is exhausted; pass it on as the terminal's EOF character.
+        try:
+            self.write_all(self.master_fd, termios.tcgetattr(self.master_fd)[6][termios.VEOF])
+        except (OSError, termios.error):
+            pass
+
+    def copy_window_size(self, *_):
+        try:
+            size = fcntl.ioctl(self.in_fd, termios.TIOCGWINSZ, struct.pack('HHHH', 0, 0, 0, 0))
+            fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, size)
+        except OSError:
+            pass
+
+    def run(self):
+        is_tty = os.isatty(self.in_fd)
+        old_term = termios.tcgetattr(self.in_fd) if is_tty else None
+        old_handler = signal.signal(signal.SIGWINCH, self.copy_window_size)
+        selector = selectors.DefaultSelector()
+        try:
+            if is_tty:
+                tty.setraw(self.in_fd)
+                self.copy_window_size()
+            sys.stdout.flush()
+            selector.register(self.master_fd, selectors.EVENT_READ)
+            try:
+                selector.register(self.in_fd, selectors.EVENT_READ)
+            except PermissionError:  # regular files and /dev/null cannot be polled
+                self.send_eof()
+
+            while True:
+                for key, _ in selector.select():
+                    if key.fd == self.master_fd:
+                        try:
+                            data = os.read(self.master_fd, self.chunk_size)
+                        except OSError:  # EIO once the child side is closed
+                            data = b""
+                        if not data:
+                            return
+                        self.write_all(self.out_fd, data)
+                    else:
+                        data = os.read(self.in_fd, self.chunk_size)
+                        if not data:
+                            selector.unregister(self.in_fd)
+                            self.send_eof()
+                            continue
+                        self.write_all(self.master_fd, data)
+        finally:
+            selector.close()
+            signal.signal(signal.SIGWINCH, old_handler)
+            if old_term is not None:
+                termios.tcsetattr(self.in_fd, termios.TCSAFLUSH, old_term)
+
+class SystemProfile:
+    # Persisted index of the executables on PATH. Each PATH directory is
+    # stored with its mtime and only rescanned when that mtime changes.
+    accessibility_candidates = ['orca', 'festival', 'espeak', 'brltty', 'at-spi2-core']
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(CACHE_DIR, 'system_profile.json')
+        self.data = None
+
+    def load(self) -> dict:
+        if self.data is None:
+            try:
+                with open(self.path, 'r') as file:
+                    data = json.load(file)
+            except (OSError, ValueError):
+                data = {}
+            if self.refresh(data):
+                self.save(data)
+            self.data = data
+        return self.data
+
+    def refresh(self, data: dict) -> bool:
+        cached_dirs = data.get("dirs", {})
+        dirs = {}
+        changed = False
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            if not directory or directory in dirs:
+                continue
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            cached = cached_dirs.get(directory)
+            if cached and cached["mtime"] == mtime:
+                dirs[directory] = cached
+            else:
+                dirs[directory] = {"mtime": mtime, "commands": self.scan(directory)}
+                changed = True
+        changed = changed or set(dirs) != set(cached_dirs)
+        data["dirs"] = dirs
+
+        uname = os.uname()
+        system_info = f"{uname.sysname} {uname.nodename} {uname.release} {uname.version} {uname.machine}"
+        changed = changed or data.get("system_info") != system_info
+        data["system_info"] = system_info
+        return changed
+
+    @staticmethod
+    def scan(directory: str) -> List[str]:
+        commands = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            commands.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return sorted(commands)
+
+    def save(self, data: dict):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    @property
+    def commands(self) -> List[str]:
+        names = set()
+        for entry in self.load()["dirs"].values():
+            names.update(entry["commands"])
+        return sorted(names)
+
+    @property
+    def system_info(self) -> str:
+        return self.load()["system_info"]
+
+    @property
+    def accessibility_tools(self) -> List[str]:
+        names = set(self.commands)
+        return [tool for tool in self.accessibility_candidates if tool in names]
+
+class FileIngestor:
+    # Turns a file into prompt text within a token budget. Small text files
+    # are passed whole; larger ones are memory-mapped and only the chunks that
+    # best match the user's words are kept, plus the first and last chunk.
+    stopwords = {'the', 'and', 'for', 'with', 'from', 'that', 'this', 'file', 'content', 'contents',
+                 'read', 'show', 'what', 'which', 'merge', 'into', 'about', 'please'}
+
+    def __init__(self, token_budget: int = 2048, chunk_lines: int = 40, mmap_threshold: int = 1024 * 1024,
+                 sniff_bytes: int = 8192):
+        self.token_budget = token_budget
+        self.chunk_lines = chunk_lines
+        self.mmap_threshold = mmap_threshold
+        self.sniff_bytes = sniff_bytes
+
+    @staticmethod
+    def byte_tokens(size: int) -> int:
+        # Same ratio as estimate_tokens, without decoding the bytes first.
+        return (size + 3) // 4
+
+    @staticmethod
+    def is_binary(sample: bytes) -> bool:
+        return b"\0" in sample
+
+    def keywords(self, query: str, file_path: str = "") -> List[bytes]:
+        words = set()
+        for word in query.lower().replace('"', ' ').replace("'", ' ').split():
+            word = word.strip('.,:;!?()[]{}')
+            if len(word) >= 3 and word not in self.stopwords and word != file_path.lower():
+                words.add(word.encode())
+        return sorted(words)
+
+    def ingest(self, file_path: str, query: str = "") -> str:
+        size = os.path.getsize(file_path)
+        if size == 0:
+            return ""
+        with open(file_path, 'rb') as file:
+            if size >= self.mmap_threshold:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = file.read()
+            try:
+                if self.is_binary(data[:self.sniff_bytes]):
+                    return f"[binary file, {size} bytes; content not included]"
+                if self.byte_tokens(size) <= self.token_budget:
+                    return bytes(data[:]).decode('utf-8', errors='replace')
+                return self.select_chunks(data, self.keywords(query, file_path))
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+    def chunk_spans(self, data) -> List[Tuple[int, int, int]]:
+        # (start offset, end offset, first line number) for every chunk.
+        spans = []
+        offset, line_no, size = 0, 1, len(data)
+        while offset < size:
+            end = offset
+            for _ in range(self.chunk_lines):
+                newline = data.find(b"\n", end)
+                if newline == -1:
+                    end = size
+                    break
+                end = newline + 1
+                if end >= size:
+                    break
+            spans.append((offset, end, line_no))
+            line_no += self.chunk_lines
+            offset = end
+        return spans
+
+    def select_chunks(self, data, keywords: List[bytes]) -> str:
+        spans = self.chunk_spans(data)
+        scores = []
+        for index, (start, end, _) in enumerate(spans):
+            chunk = data[start:end].lower()
+            scores.append((sum(chunk.count(word) for word in keywords), -index))
+
+        # Matching chunks first, best score first; then the first and last
+        # chunk for orientation if they still fit.
+        ranked = [-neg_index for score, neg_index in sorted(scores, reverse=True) if score > 0]
+        chosen = set()
+        used = 0
+        for index in ranked + [0, len(spans) - 1]:
+            cost = self.byte_tokens(spans[index][1] - spans[index][0])
+            if index in chosen or used + cost > self.token_budget:
+                continue
+            chosen.add(index)
+            used += cost
+        if not chosen:
+            chosen.add(ranked[0] if ranked else 0)
+
+        parts = []
+        previous = -1
+        for index in sorted(chosen):
+            start, end, line_no = spans[index]
+            if index != previous + 1:
+                parts.append(f"[... lines {spans[previous + 1][2]}-{line_no - 1} omitted ...]\n")
+            text = data[start:end].decode('utf-8', errors='replace')
+            budget_chars = max(0, (self.token_budget - estimate_tokens("".join(parts))) * 4)
+            parts.append(text[:budget_chars])
+            previous = index
+        if previous != len(spans) - 1:
+            parts.append(f"[... lines from {spans[previous + 1][2]} omitted ...]\n")
+        return "".join(parts)
+
+    def split_chunks(self, text: str, token_budget: int) -> List[str]:
+        # Split source code into pieces under token_budget, preferring to cut
+        # where a top-level definition starts.
+        chunks, current = [], []
+        for line in text.splitlines(keepends=True):
+            starts_block = line[:1].strip() != "" and not line.startswith((')', ']', '}'))
+            if current and starts_block and estimate_tokens("".join(current) + line) > token_budget:
+                chunks.append("".join(current))
+                current = []
+            current.append(line)
+            if estimate_tokens("".join(current)) > token_budget * 2:
+                chunks.append("".join(current))
+                current = []
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+class ErrorCompressor:
+    # Shrinks command error output for the debugger and error handler
+    # prompts. Runs of lines that differ only in numbers or paths become one
+    # line with a count, and a line shape seen many times is summarised once.
+    # If that is still over budget, the first and last error blocks, other
+    # root-cause lines, the tail and the head are kept, in that order.
+    template_pattern = re.compile(r"[\w.~-]*/[\w./~-]+|0x[0-9a-fA-F]+|\d+(?:\.\d+)?")
+    root_cause_pattern = re.compile(
+        r"Traceback \(most recent call last\)|\b(?:error|fatal|panic|failed|failure)\b\s*[:\[]|"
+        r"^\w+(?:Error|Exception)\b|command not found|No such file or directory|Permission denied|"
+        r"Segmentation fault|undefined reference|cannot find", re.IGNORECASE)
+
+    def __init__(self, token_budget: int = 1024, max_repeats: int = 3, block_lines: int = 15, head_lines: int = 10,
+                 tail_lines: int = 30, max_line_chars: int = 400, max_summaries: int = 10):
+        self.token_budget = token_budget
+        self.max_repeats = max_repeats
+        self.block_lines = block_lines
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.max_line_chars = max_line_chars
+        self.max_summaries = max_summaries
+
+    def template(self, line: str) -> str:
+        return self.template_pattern.sub(lambda match: "<path>" if "/" in match.group() else "<n>", line).strip()
+
+    def collapse(self, lines: List[str]) -> Tuple[List[str], List[str]]:
+        # Returns the collapsed lines, plus one summary line for each of the
+        # most frequent line shapes that were dropped.
+        runs = []  # [template, first line, count, all identical]
+        occurrences = {}
+        dropped = {}
+        previous = None
+        for line in lines:
+            if len(line) > self.max_line_chars:
+                line = line[:self.max_line_chars] + " [...]"
+            key = self.template(line)
+            follows_run = key == previous
+            previous = key
+            if follows_run and runs and runs[-1][0] == key:
+                runs[-1][2] += 1
+                runs[-1][3] = runs[-1][3] and line == runs[-1][1]
+                continue
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if key and occurrences[key] > self.max_repeats:
+                if not follows_run:
+                    dropped[key] = dropped.get(key, 0) + 1
+                continue
+            runs.append([key, line, 1, True])
+
+        collapsed = []
+        for key, line, count, identical in runs:
+            if count == 1 or not key:
+                collapsed.append(line)
+            elif identical:
+                collapsed.append(f"{line}  [repeated {count} times]")
+            else:
+                collapsed.append(f"{line}  [+{count - 1} similar lines]")
+        frequent = sorted(dropped.items(), key=lambda item: -item[1])[:self.max_summaries]
+        return collapsed, [f"[{count} more lines like: {key}]" for key, count in frequent]
+
+    def compress(self, text: str, token_budget: int = None) -> str:
+        budget = token_budget or self.token_budget
+        if not text:
+            return text
+        lines, summaries = self.collapse(text.splitlines())
+        if estimate_tokens("\n".join(lines + summaries)) <= budget:
+            return "\n".join(lines + summaries)
+        # Summaries get at most a quarter of the budget, most frequent first.
+        kept, used = [], 0
+        for summary in summaries:
+            cost = estimate_tokens(summary) + 1
+            if used + cost > budget // 4:
+                break
+            kept.append(summary)
+            used += cost
+        return "\n".join([self.select(lines, budget - used)] + kept)
+
+    def select(self, lines: List[str], budget: int) -> str:
+        causes = [index for index, line in enumerate(lines) if self.root_cause_pattern.search(line)]
+        priority = []
+        if causes:
+            first = causes[0]
+            priority.extend(range(first, min(len(lines), first + self.block_lines)))
+            # The last block ends a little after the last root-cause line and,
+            # for a Python traceback, starts at its "Traceback" header.
+            last = causes[-1]
+            headers = [index for index in causes if lines[index].startswith("Traceback") and index <= last]
+            start = headers[-1] if headers else last
+            end = min(len(lines), last + 3)
+            priority.extend(range(max(start, end - self.block_lines), end))
+            priority.extend(causes)
+        priority.extend(range(max(0, len(lines) - self.tail_lines), len(lines)))
+        priority.extend(range(min(self.head_lines, len(lines))))
+
+        chosen = set()
+        used = 0
+        for index in priority:
+            cost = estimate_tokens(lines[index]) + 1
+            if index in chosen or used + cost > budget:
+                continue
+            chosen.add(index)
+            used += cost
+
+        parts = []
+        previous = -1
+        for index in sorted(chosen):
+            if index != previous + 1:
+                parts.append(f"[... {index - previous - 1} lines omitted ...]")
+            parts.append(lines[index])
+            previous = index
+        if previous != len(lines) - 1:
+            parts.append(f"[... {len(lines) - previous - 1} lines omitted ...]")
+        return "\n".join(parts)
+
+class CommandCatalogue:
+    # Installed command names with one-line descriptions from the man page
+    # index (`man -k`), built once per set of installed commands and cached.
+    # A small BM25 index picks the commands relevant to each request.
+    whatis_pattern = re.compile(r"^(\S+?)(?:,\s*\S+)*\s+\((\w+)\)\s+-+\s+(.*)$")
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, system_profile: SystemProfile, path: str = None):
+        self.system_profile = system_profile
+        self.path = path or os.path.join(CACHE_DIR, 'command_catalogue.json')
+        self.entries = None
+        self.postings = {}
+        self.lengths = []
+        self.average_length = 1.0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        tokens = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            tokens.append(word)
+        return tokens
+
+    def signature(self, commands: List[str]) -> str:
+        return hashlib.sha256("\n".join(commands).encode()).hexdigest()
+
+    def describe(self, commands: List[str]) -> dict:
+        installed = set(commands)
+        descriptions = {}
+        try:
+            output = subprocess.run(['man', '-k', '.'], capture_output=True, text=True, timeout=20,
+                                    stdin=subprocess.DEVNULL, env=dict(os.environ, MANWIDTH='1000')).stdout
+        except (OSError, subprocess.SubprocessError):
+            output = ""
+        for line in output.splitlines():
+            match = self.whatis_pattern.match(line.strip())
+            if match and match.group(1) in installed and match.group(2)[:1] in "168":
+                descriptions.setdefault(match.group(1), match.group(3).strip())
+        return descriptions
+
+    def load(self) -> List[Tuple[str, str]]:
+        if self.entries is not None:
+            return self.entries
+        commands = self.system_profile.commands
+        signature = self.signature(commands)
+        try:
+            with open(self.path, 'r') as file:
+                cached = json.load(file)
+            if cached.get("signature") != signature:
+                cached = None
+        except (OSError, ValueError):
+            cached = None
+        if cached is None:
+            descriptions = self.describe(commands)
+            cached = {"signature": signature,
+                      "entries": [[name, descriptions.get(name, "")] for name in commands]}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as file:
+                    json.dump(cached, file)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+        self.entries = [tuple(entry) for entry in cached["entries"]]
+        self.build_index()
+        return self.entries
+
+    def build_index(self):
+        self.postings = {}
+        self.lengths = []
+        for index, (name, description) in enumerate(self.entries):
+            # The name counts twice so that an exact name hit outranks a
+            # passing mention in another command's description.
+            tokens = self.tokenize(name) * 2 + self.tokenize(description)
+            self.lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                self.postings.setdefault(token, []).append((index, count))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+
+    def relevant(self, query: str, limit: int = 15) -> List[Tuple[str, str]]:
+        entries = self.load()
+        total = len(entries)
+        scores = {}
+        for token in set(self.tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = count + self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average_length)
+                scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], entries[item[0]][0]))
+        return [entries[index] for index, _ in ranked[:limit]]
+
+DATA_DIR = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'terminal-assistant')
+
+class HistoryStore:
+    # Persistent command history in SQLite. An FTS5 index over the inputs
+    # lets each new request pull the most similar past successful
+    # translations (ranked by BM25) as few-shot examples.
+    def __init__(self, path: str = None, max_entries: int = 20000):
+        self.path = path or os.path.join(DATA_DIR, 'history.db')
+        self.max_entries = max_entries
+        self.conn = None
+        self.fts = False
+        self.lock = threading.RLock()
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY, ts REAL NOT NULL, cwd TEXT, input TEXT NOT NULL, command TEXT NOT NULL,
+                exit_code INTEGER, duration_ms REAL, source TEXT)""")
+            try:
+                conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS history_fts
+                    USING fts5(input, content='history', content_rowid='id')""")
+                conn.execute("""CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts(rowid, input) VALUES (new.id, new.input); END""")
+                conn.execute("""CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts(history_fts, rowid, input) VALUES ('delete', old.id, old.input); END""")
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5; similar() falls back to LIKE.
+                self.fts = False
+            self.conn = conn
+        return self.conn
+
+    def record(self, user_input: str, command: str, exit_code: int, duration_ms: float = None,
+               cwd: str = None, source: str = None):
+        with self.lock:
+            try:
+                conn = self.connect()
+                cursor = conn.execute("""INSERT INTO history (ts, cwd, input, command, exit_code, duration_ms, source)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""", (time.time(), cwd, user_input, command, exit_code, duration_ms, source))
+                if cursor.lastrowid % 500 == 0:
+                    conn.execute("DELETE FROM history WHERE id <= ?", (cursor.lastrowid - self.max_entries,))
+            except sqlite3.Error:
+                pass
+
+    def recent(self, limit: int = 10) -> List[str]:
+        with self.lock:
+            try:
+                rows = self.connect().execute("SELECT command FROM history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            except sqlite3.Error:
+                return []
+        return [row[0] for row in reversed(rows)]
+
+    def similar(self, query: str, limit: int = 3) -> List[Tuple[str, str]]:
+        words = list(dict.fromkeys(re.findall(r"\w+", query.lower())))[:16]
+        if not words:
+            return []
+        with self.lock:
+            try:
+                conn = self.connect()
+                # Only real translations make useful examples, not commands typed verbatim.
+                if self.fts:
+                    rows = conn.execute("""SELECT h.input, h.command FROM history_fts
+                        JOIN history h ON h.id = history_fts.rowid
+                        WHERE history_fts MATCH ? AND h.exit_code = 0 AND h.input != h.command
+                        ORDER BY bm25(history_fts) LIMIT ?""",
+                        (" OR ".join(f'"{word}"' for word in words), limit * 4)).fetchall()
+                else:
+                    clause = " OR ".join("input LIKE ?" for _ in words)
+                    rows = conn.execute(f"""SELECT input, command FROM history
+                        WHERE ({clause}) AND exit_code = 0 AND input != command ORDER BY id DESC LIMIT ?""",
+                        [f"%{word}%" for word in words] + [limit * 4]).fetchall()
+            except sqlite3.Error:
+                return []
+        examples, seen = [], set()
+        for user_input, command in rows:
+            if command not in seen:
+                seen.add(command)
+                examples.append((user_input, command))
+        return examples[:limit]
 
 class DataGatherer:
+    def __init__(self, file_ingestor: FileIngestor = None):
+        self.file_ingestor = file_ingestor or FileIngestor()
+
     @staticmethod
     def get_clipboard_content():
         try:
+            import pyperclip
             return pyperclip.paste()
         except:
             return "Error: Unable to access clipboard"
 
-    @staticmethod
-    def get_file_content(file_path):
+    def get_file_content(self, file_path, query: str = ""):
         try:
-            with open(file_path, 'r') as file:
-                return file.read()
+            return self.file_ingestor.ingest(file_path, query)
         except Exception as e:
             return f"Error reading file: {str(e)}"
 
@@ -107,34 +1710,113 @@ class DataGatherer:
             return f"Error executing command: {str(e)}"
 
 class AITerminalAssistant:
-    def __init__(self, model_name: str = "llama3.1:8b", max_tokens: int = 16384):
+    def __init__(self, model_name: str = "llama3.1:8b", max_tokens: int = 16384, transport: OllamaTransport = None,
+                 config: dict = None):
         self.username = getpass.getuser()
         self.home_folder = os.path.expanduser("~")
         self.current_directory = os.getcwd()
-
-        self.command_executor = Node(model_name, "Command Executor", max_tokens=max_tokens)
-        self.error_handler = Node(model_name, "Error Handler", max_tokens=max_tokens)
-        self.debugger = Node(model_name, "Debugger Expert", max_tokens=max_tokens)
-        self.merger = Node(model_name, "Code Merger", max_tokens=max_tokens)
-        self.question_answerer = Node(model_name, "Question Answerer", max_tokens=max_tokens)
+        # PATH that commands will run with; None means this process's own.
+        # Daemon sessions set it to the client's.
+        self.search_path = None
+
+        self.config = load_config() if config is None else config
+        self.router = ModelRouter(self.config, model_name, transport)
+        route = self.router
+        self.command_executor = Node(route.model_for("command_executor"), "Command Executor", max_tokens=max_tokens,
+                                     transport=route.transport_for("command_executor"), context_budget=2048,
+                                     timeout=route.timeout_for("command_executor"))
+        self.error_handler = Node(route.model_for("error_handler"), "Error Handler", max_tokens=max_tokens,
+                                  transport=route.transport_for("error_handler"), context_budget=1024,
+                                  timeout=route.timeout_for("error_handler"))
+        self.debugger = Node(route.model_for("debugger"), "Debugger Expert", max_tokens=max_tokens,
+                             transport=route.transport_for("debugger"), context_budget=4096,
+                             timeout=route.timeout_for("debugger"))
+        self.merger = Node(route.model_for("merger"), "Code Merger", max_tokens=max_tokens,
+                           transport=route.transport_for("merger"), context_budget=8192,
+                           timeout=route.timeout_for("merger"))
+        self.question_answerer = Node(route.model_for("question_answerer"), "Question Answerer", max_tokens=max_tokens,
+                                      transport=route.transport_for("question_answerer"), context_budget=4096,
+                                      timeout=route.timeout_for("question_answerer"))
         self.data_gatherer = DataGatherer()
+        self.error_compressor = ErrorCompressor()
+        self.translation_cache = TranslationCache()
+        self.shell_classifier = ShellClassifier()
+        self.system_profile = SystemProfile()
+        self.telemetry = get_telemetry()
+        self.history_store = HistoryStore()
+        self.command_catalogue = CommandCatalogue(self.system_profile)
 
         self.command_history = []
-        self.initialize_system_context()
+        self.system_context_ready = False
+        self.system_context_lock = threading.Lock()
+
+        self.merge_chunk_tokens = 3072
+
+        self.capture_head_bytes = 64 * 1024
+        self.capture_tail_bytes = 256 * 1024
+
+        # (command, Future) for the debugging suggestion being worked out in the background.
+        self.pending_debug = None
+
+        # Translations sampled concurrently per request (see generate_candidates),
+        # and how many times handle_error may re-run a corrected command.
+        self.command_candidates = route.nodes.get("command_executor", {}).get("candidates", 1)
+        self.max_error_retries = 2
+
+    def ensure_system_context(self):
+        # Deferred until the first model call so the prompt appears without
+        # waiting for the PATH scan.
+        with self.system_context_lock:
+            if not self.system_context_ready:
+                self.initialize_system_context()
+                if not self.command_history:
+                    self.command_history = self.history_store.recent(10)
+                self.system_context_ready = True
+
+    def warm_up(self, background: bool = True):
+        def run():
+            self.ensure_system_context()
+            # The command executor goes last: the first prompt is most likely
+            # a translation, and nodes sharing its model and host would
+            # otherwise evict its prefix from Ollama's cache.
+            for node in self.nodes()[1:] + [self.command_executor]:
+                node.warm_up()
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def nodes(self) -> List[Node]:
+        return [self.command_executor, self.error_handler, self.debugger, self.merger, self.question_answerer]
+
+    def new_session(self, cwd: str = None) -> 'AITerminalAssistant':
+        # Per-client view for the daemon: transport, caches, history and the
+        # system profile are shared; conversation state and cwd are not.
+        self.ensure_system_context()
+        session = copy.copy(self)
+        session.command_executor = self.command_executor.fork()
+        session.error_handler = self.error_handler.fork()
+        session.debugger = self.debugger.fork()
+        session.merger = self.merger.fork()
+        session.question_answerer = self.question_answerer.fork()
+        session.command_history = list(self.command_history)
+        session.current_directory = cwd or self.current_directory
+        session.pending_debug = None
+        return session
+
+    @staticmethod
+    def call(node: Node, *args, **kwargs):
+        # Runs a Node call on the async core and waits for it, so Ctrl-C
+        # and the Node's deadline cancel the request itself.
+        return get_async_core().run(node.acall(*args, **kwargs))
 
     def initialize_system_context(self):
-        path_dirs = os.environ.get('PATH', '').split(os.pathsep)
-        installed_commands = []
-        for dir in path_dirs:
-            if os.path.isdir(dir):
-                installed_commands.extend([f for f in os.listdir(dir) if os.access(os.path.join(dir, f), os.X_OK)])
-        installed_commands = list(set(installed_commands))
-        
-        try:
-            system_info = subprocess.check_output("uname -a", shell=True, text=True).strip()
-        except subprocess.CalledProcessError:
-            system_info = "Unable to retrieve system information"
-        
+        self.command_catalogue.load()
+        system_info = self.system_profile.system_info
+
         desktop_env = os.environ.get('XDG_CURRENT_DESKTOP', 'Unknown')
         
         accessibility_tools = self.get_accessibility_tools()
@@ -144,10 +1826,8 @@ class AITerminalAssistant:
         Use these details for context:
         - Username: {self.username}
         - Home folder: {self.home_folder}
-        - Current working directory: {self.current_directory}
         - System information: {system_info}
         - Desktop environment: {desktop_env}
-        - Installed commands: {', '.join(installed_commands[:100])}
         - Available accessibility tools: {', '.join(accessibility_tools)}
         IMPORTANT:
         - If the input is already a valid shell command, return it as is.
@@ -162,6 +1842,7 @@ class AITerminalAssistant:
         - DO NOT combine multiple commands using ';', '&&', or '|'.
         - DO NOT provide any explanations or comments. Return ONLY the command.
         - For accessibility-related queries, use the appropriate tools from the list provided.
+        - Prefer the relevant installed commands listed in the additional data.
         - Always use the actual filenames provided in the additional data, not placeholders.
         - Ensure to properly escape any special characters to maintain shell compatibility.
         - NEVER interpret 'clear' as anything other than the 'clear' command.
@@ -201,16 +1882,9 @@ class AITerminalAssistant:
         """
 
     def get_accessibility_tools(self):
-        accessibility_tools = []
-        potential_tools = ['orca', 'festival', 'espeak', 'brltty', 'at-spi2-core']
-        
-        for tool in potential_tools:
-            if subprocess.call(['which', tool], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0:
-                accessibility_tools.append(tool)
-        
-        return accessibility_tools
+        return self.system_profile.accessibility_tools
 
-    def execute_command_with_live_output(self, command: str) -> Tuple[str, str, int]:
+    def execute_command_with_live_output(self, command: str, out_fd: int = None) -> Tuple[str, str, int]:
         interactive_commands = ['top', 'nano', 'vim', 'less', 'more']
         is_interactive = any(command.strip().startswith(cmd) for cmd in interactive_commands)
 
@@ -226,47 +1900,21 @@ class AITerminalAssistant:
             stderr=subprocess.PIPE,
             stdin=subprocess.PIPE,
             shell=True,
-            universal_newlines=True,
+            bufsize=0,
             preexec_fn=os.setsid
         )
 
-        for pipe in [process.stdout, process.stderr]:
-            flags = fcntl.fcntl(pipe, fcntl.F_GETFL)
-            fcntl.fcntl(pipe, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-
-        stdout_data, stderr_data = [], []
+        engine = CaptureEngine(head_bytes=self.capture_head_bytes, tail_bytes=self.capture_tail_bytes, out_fd=out_fd)
+        started = time.perf_counter()
 
         try:
             if command.startswith('sudo -S'):
                 password = getpass.getpass("Enter sudo password: ")
-                process.stdin.write(f"{password}\n")
+                process.stdin.write(f"{password}\n".encode())
                 process.stdin.flush()
 
-            while True:
-                ready, _, _ = select.select([process.stdout, process.stderr], [], [], 0.1)
-                
-                if process.stdout in ready:
-                    stdout = process.stdout.read()
-                    if stdout:
-                        print(stdout, end='', flush=True)
-                        stdout_data.append(stdout)
-                
-                if process.stderr in ready:
-                    stderr = process.stderr.read()
-                    if stderr:
-                        print(f"{format_text('red')}{stderr}{reset_format()}", end='', flush=True)
-                        stderr_data.append(stderr)
-                
-                if process.poll() is not None:
-                    break
-
-            stdout, stderr = process.communicate(timeout=0.1)
-            if stdout:
-                print(stdout, end='', flush=True)
-                stdout_data.append(stdout)
-            if stderr:
-                print(f"{format_text('red')}{stderr}{reset_format()}", end='', flush=True)
-                stderr_data.append(stderr)
+            engine.run(process)
+            process.wait()
 
         except KeyboardInterrupt:
             os.killpg(os.getpgid(process.pid), signal.SIGINT)
@@ -278,47 +1926,32 @@ class AITerminalAssistant:
                 os.killpg(os.getpgid(process.pid), signal.SIGTERM)
             except:
                 pass
-        
+            engine.close()
+
         exit_code = process.returncode if process.returncode is not None else -1
-        full_stdout = ''.join(stdout_data)
-        full_stderr = ''.join(stderr_data)
+        self.telemetry.record("Shell", "command", (time.perf_counter() - started) * 1000,
+                              exit_code=exit_code, **engine.stats())
 
-        return full_stdout, full_stderr, exit_code
+        return engine.stdout.text(), engine.stderr.text(), exit_code
 
     def execute_interactive_command(self, command: str) -> Tuple[str, str, int]:
         try:
             pid, fd = pty.fork()
 
             if pid == 0:  # Child process
-                os.execvp(command.split()[0], command.split())
+                # Run through the shell so quoting, globs and pipes behave as typed.
+                try:
+                    os.execv('/bin/sh', ['/bin/sh', '-c', command])
+                finally:
+                    os._exit(127)
             else:  # Parent process
-                old_term = termios.tcgetattr(sys.stdin)
-                tty.setraw(sys.stdin.fileno())
-
-                rows, cols = struct.unpack('hh', fcntl.ioctl(sys.stdin, termios.TIOCGWINSZ, b'1234'))
-
                 try:
-                    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('hh', rows, cols))
-
-                    while True:
-                        try:
-                            data = os.read(fd, 1024)
-                            if not data:
-                                break
-                            sys.stdout.write(data.decode())
-                            sys.stdout.flush()
-                        except OSError:
-                            break
-
-                        if select.select([sys.stdin], [], [], 0)[0]:
-                            input_data = sys.stdin.read(1)
-                            os.write(fd, input_data.encode())
-
+                    PtyRelay(fd).run()
                 finally:
-                    termios.tcsetattr(sys.stdin, termios.TCSAFLUSH, old_term)
+                    os.close(fd)
 
             _, exit_status = os.waitpid(pid, 0)
-            exit_code = exit_status >> 8
+            exit_code = os.waitstatus_to_exitcode(exit_status)
 
             return "", "", exit_code
 
@@ -326,7 +1959,9 @@ class AITerminalAssistant:
             print(f"{format_text('red')}Error during interactive command execution: {str(e)}{reset_format()}")
             return "", str(e), -1
 
-    def execute_command(self, user_input: str) -> str:
+    def execute_command(self, user_input: str, depth: int = 0) -> str:
+        # depth: how many handle_error corrections led here.
+        command = user_input
         try:
             self.current_directory = os.getcwd()
             
@@ -337,20 +1972,37 @@ class AITerminalAssistant:
                 os.system('clear')
                 return ""
 
+            if user_input.strip() == ':stats':
+                return self.stats_report()
+
+            if user_input.strip() == ':debug':
+                return self.debug_suggestion(block=True) or "No debugging suggestion is pending."
+
+            if user_input.split()[:1] == [':merge']:
+                return self.merge_file(user_input)
+
+            # ":" followed by a space is the shell's no-op builtin.
+            if user_input.startswith(':') and user_input[1:2].isalpha():
+                return f"Unknown command: {user_input.split()[0]}"
+
             if user_input.startswith('!'):
-                return self.run_direct_command(user_input[1:])
-            
-            additional_data = self.gather_additional_data(user_input)
+                return self.run_direct_command(user_input[1:], depth)
 
-            command = self.command_executor(f"""
-            User Input: {user_input}
-            Current Directory: {self.current_directory}
-            Translate the user input into a SINGLE shell command. Return ONLY the command, nothing else.
-            If the input is already a valid shell command, return it as is.
-            Do not provide any explanations or comments.
-            Use the actual filenames and content provided in the additional data.
-            """, additional_data=additional_data).strip()
-            
+            if self.shell_classifier.is_shell_command(user_input, self.current_directory):
+                command = self.shell_classifier.expand_alias(user_input)
+                if self.shell_classifier.is_destructive(command):
+                    confirmation = input(f"{format_text('yellow', bold=True)}Warning: This command may be destructive. Are you sure you want to run '{command}'? (y/n) {reset_format()}")
+                    if confirmation.lower() != 'y':
+                        return f"{format_text('red', bold=True)}Command execution aborted.{reset_format()}"
+                return self.run_direct_command(command, depth)
+
+            try:
+                command, cached, cache_key = self.translate_command(user_input)
+            except TranslationFailed as e:
+                return f"{format_text('red')}Could not translate the request: {e}{reset_format()}"
+            translated = command
+
+            # Cached translations still keep their CONFIRM: prefix, so they pass this gate too.
             if command.startswith("CONFIRM:"):
                 confirmation = input(f"{format_text('yellow', bold=True)}Warning: This command may be destructive. Are you sure you want to run '{command[8:]}'? (y/n) {reset_format()}")
                 if confirmation.lower() != 'y':
@@ -364,24 +2016,213 @@ class AITerminalAssistant:
             if len(self.command_history) > 10:
                 self.command_history.pop(0)
 
-            if command.startswith("cd "):
-                path = command.split(" ", 1)[1]
-                os.chdir(os.path.expanduser(path))
-                result = f"Changed directory to {os.getcwd()}"
+            started = time.perf_counter()
+            target = cd_target(command)
+            if target is not None:
+                result = change_directory(target)
                 exit_code = 0
             else:
                 stdout, stderr, exit_code = self.execute_command_with_live_output(command)
                 result = ""
+            self.history_store.record(user_input, command, exit_code, (time.perf_counter() - started) * 1000,
+                                      self.current_directory, "cache" if cached else "model")
+
+            if exit_code == 0 and not cached:
+                self.translation_cache.put(cache_key, translated, self.current_directory)
 
             if exit_code != 0:
-                debug_suggestion = self.debug_error(command, stderr, exit_code)
-                result += f"\n\n{format_text('yellow', bold=True)}Debugging Suggestion:{reset_format}\n{debug_suggestion}"
+                self.debug_in_background(command, stderr, exit_code)
 
             return result.strip()
         except Exception as e:
-            return self.handle_error(str(e), user_input, command)
+            return self.handle_error(str(e), user_input, command, depth)
+
+    def translate_command(self, user_input: str, stateless: bool = False) -> Tuple[str, bool, str]:
+        # Returns (command, came_from_cache, cache_key). The command may still
+        # carry the CONFIRM: prefix. Raises TranslationFailed if the model
+        # call fails.
+        translate_started = time.perf_counter()
+        self.ensure_system_context()
+        additional_data = self.gather_additional_data(user_input)
+
+        cache_key = self.translation_cache.make_key(self.command_executor.model_name, user_input,
+                                                    self.current_directory, additional_data)
+        command = self.translation_cache.get(cache_key)
+        cached = command is not None
+        if not cached:
+            # Added after the cache key is taken: examples change as history
+            # grows and the catalogue changes as commands are installed.
+            additional_data = dict(additional_data)
+            relevant = self.command_catalogue.relevant(user_input, 15)
+            if relevant:
+                additional_data["relevant_installed_commands"] = "\n" + "\n".join(
+                    f"{name} - {description}" if description else name for name, description in relevant)
+            examples = self.history_store.similar(user_input, 3)
+            if examples:
+                additional_data["similar_past_translations"] = "\n" + "\n".join(
+                    f"{past_input} => {past_command}" for past_input, past_command in examples)
+            command = self.generate_command(f"""
+            User Input: {user_input}
+            Current Directory: {self.current_directory}
+            Translate the user input into a SINGLE shell command. Return ONLY the command, nothing else.
+            If the input is already a valid shell command, return it as is.
+            Do not provide any explanations or comments.
+            Use the actual filenames and content provided in the additional data.
+            Similar past translations, if given, show how this user phrases requests.
+            """, additional_data, stateless)
+        self.telemetry.record("Assistant", "translate", (time.perf_counter() - translate_started) * 1000,
+                              source="cache" if cached else "model")
+        return command, cached, cache_key
+
+    def generate_command(self, prompt: str, additional_data: dict, stateless: bool = False) -> str:
+        if self.command_candidates <= 1:
+            command = self.call(self.command_executor, prompt, additional_data=additional_data, first_line=True,
+                                stateless=stateless).strip()
+            if command.startswith("Error in"):
+                raise TranslationFailed(command)
+            return command
+        command = get_async_core().run(self.generate_candidates(prompt, additional_data))
+        if not stateless:
+            self.command_executor.remember(prompt, command)
+        return command
+
+    async def generate_candidates(self, prompt: str, additional_data: dict) -> str:
+        # Several samples at once, each with its own seed and temperature.
+        # The first to pass the local checks wins and the rest are cancelled.
+        # If none pass, nothing is run: TranslationFailed lists the problems.
+        import asyncio
+        started = time.perf_counter()
+
+        async def candidate(number: int):
+            options = {"seed": number, "temperature": min(1.0, 0.2 + 0.3 * number)}
+            command = (await self.command_executor.acall(prompt, additional_data, first_line=True, stateless=True,
+                                                         options=options)).strip()
+            if command.startswith("Error in"):
+                return command, command
+            problem = await asyncio.to_thread(self.shell_classifier.validate, command, self.current_directory,
+                                              self.search_path)
+            return command, problem
+
+        tasks = [asyncio.ensure_future(candidate(number)) for number in range(self.command_candidates)]
+        chosen, tried, rejected = None, 0, []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                command, problem = await next_done
+                tried += 1
+                if not problem:
+                    chosen = command
+                    break
+                rejected.append((command, problem))
+        finally:
+            for task in tasks:
+                task.cancel()
+        self.telemetry.record("Assistant", "candidates", (time.perf_counter() - started) * 1000, tried=tried,
+                              rejected=len(rejected), valid=len(rejected) < tried)
+        if chosen is None:
+            raise TranslationFailed("no candidate passed the checks: " + "; ".join(
+                problem if command == problem else f"'{command}' ({problem})" for command, problem in rejected))
+        return chosen
+
+    def batch_translate(self, user_input: str, stateless: bool = True) -> dict:
+        started = time.perf_counter()
+        cwd = self.current_directory
+        if user_input.startswith('!'):
+            command, source, cache_key = user_input[1:], "direct", None
+        elif self.shell_classifier.is_shell_command(user_input, self.current_directory, self.search_path):
+            command, source, cache_key = self.shell_classifier.expand_alias(user_input, self.search_path), "fast_path", None
+        else:
+            command, cached, cache_key = self.translate_command(user_input, stateless=stateless)
+            source = "cache" if cached else "model"
+        destructive = command.startswith("CONFIRM:") or (source != "model"
+                                                         and self.shell_classifier.is_destructive(command))
+        if command.startswith("CONFIRM:"):
+            command = command[8:].strip()
+        return {"command": command, "source": source, "cache_key": cache_key, "destructive": destructive,
+                "cwd": cwd, "translate_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    def run_batch(self, lines, workers: int = 4, dry_run: bool = False, assume_yes: bool = False, out=None):
+        # Translations run concurrently on a bounded pool, at most 2 * workers
+        # ahead of execution. Commands then run one at a time in input order,
+        # with output captured instead of echoed, and each result is one JSON line.
+        # A task that changes directory invalidates the translations queued
+        # behind it, so those are redone against the new directory.
+        out = out or sys.stdout
+        self.current_directory = os.getcwd()
+        self.ensure_system_context()
+        pending = deque()
+        failures = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool, open(os.devnull, 'wb') as devnull:
+            def emit(line_number, user_input, future) -> bool:
+                # Returns whether the task changed the working directory.
+                nonlocal failures
+                result = {"line": line_number, "input": user_input}
+                try:
+                    result.update(future.result())
+                except Exception as e:
+                    result.update(status="error", error=str(e))
+                else:
+                    result.update(self.run_batch_command(result, dry_run, assume_yes, devnull.fileno()))
+                cache_key = result.pop("cache_key", None)
+                translated_in = result.pop("cwd", None)
+                if result.get("exit_code") == 0 and result["source"] == "model":
+                    self.translation_cache.put(cache_key, self.cacheable(result), translated_in)
+                if "exit_code" in result:
+                    self.history_store.record(user_input, result["command"], result["exit_code"],
+                                              result.get("run_ms"), os.getcwd(), result["source"])
+                if result["status"] in ("error", "failed"):
+                    failures += 1
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                return result["status"] == "ok" and cd_target(result["command"]) is not None
+
+            def emit_next():
+                if emit(*pending.popleft()) and pending:
+                    stale = list(pending)
+                    pending.clear()
+                    for line_number, user_input, future in stale:
+                        future.cancel()
+                        pending.append((line_number, user_input, pool.submit(self.batch_translate, user_input)))
+
+            for line_number, line in enumerate(lines, 1):
+                user_input = line.strip()
+                if not user_input or user_input.startswith('#'):
+                    continue
+                pending.append((line_number, user_input, pool.submit(self.batch_translate, user_input)))
+                if len(pending) >= workers * 2:
+                    emit_next()
+            while pending:
+                emit_next()
+        return failures
 
-    def run_direct_command(self, command: str) -> str:
+    @staticmethod
+    def cacheable(result: dict) -> str:
+        # Put the CONFIRM: prefix back so a later cache hit is still gated.
+        return f"CONFIRM: {result['command']}" if result.get("destructive") else result["command"]
+
+    def run_batch_command(self, result: dict, dry_run: bool, assume_yes: bool, out_fd: int) -> dict:
+        command = result["command"]
+        destructive = result["destructive"]
+        update = {}
+        if dry_run:
+            update["status"] = "dry_run"
+        elif destructive and not assume_yes:
+            update["status"] = "skipped"
+        elif cd_target(command) is not None:
+            try:
+                change_directory(cd_target(command))
+                self.current_directory = os.getcwd()
+                update.update(status="ok", exit_code=0)
+            except OSError as e:
+                update.update(status="failed", exit_code=1, stderr=str(e))
+        else:
+            started = time.perf_counter()
+            stdout, stderr, exit_code = self.execute_command_with_live_output(command, out_fd=out_fd)
+            update.update(status="ok" if exit_code == 0 else "failed", exit_code=exit_code,
+                          run_ms=round((time.perf_counter() - started) * 1000, 3),
+                          stdout=stdout[-4096:], stderr=stderr[-4096:])
+        return update
+
+    def run_direct_command(self, command: str, depth: int = 0) -> str:
         try:
             formatted_command = f"{format_text('white', inverted=True)}Direct Command: {command}{reset_format()}"
             print(formatted_command)
@@ -390,19 +2231,28 @@ class AITerminalAssistant:
             if len(self.command_history) > 10:
                 self.command_history.pop(0)
 
+            target = cd_target(command)
+            if target is not None:
+                result = change_directory(target)
+                self.history_store.record(command, command, 0, 0.0, self.current_directory, "direct")
+                return result
+
+            started = time.perf_counter()
             stdout, stderr, exit_code = self.execute_command_with_live_output(command)
+            self.history_store.record(command, command, exit_code, (time.perf_counter() - started) * 1000,
+                                      self.current_directory, "direct")
 
             result = ""
 
             if exit_code != 0:
-                debug_suggestion = self.debug_error(command, stderr, exit_code)
-                result += f"\n\n{format_text('yellow', bold=True)}Debugging Suggestion:{reset_format}\n{debug_suggestion}"
+                self.debug_in_background(command, stderr, exit_code)
 
             return result.strip()
         except Exception as e:
-            return self.handle_error(str(e), command, command)
+            return self.handle_error(str(e), command, command, depth)
 
-    def answer_question(self, question: str) -> str:
+    def answer_question(self, question: str, on_token=None) -> str:
+        self.ensure_system_context()
         context = f"""
         Command History (last 10 commands):
         {', '.join(self.command_history)}
@@ -410,16 +2260,18 @@ class AITerminalAssistant:
         Current Directory: {self.current_directory}
         """
 
-        answer = self.question_answerer(f"""
+        if on_token is None:
+            print(f"{format_text('cyan', bold=True)}Answer:{reset_format()}")
+        answer = self.call(self.question_answerer, f"""
         Question: {question.strip('?')}
 
         Context:
         {context}
 
         Please provide a clear and concise answer to the question, taking into account the given context.
-        """)
+        """, render=True, on_token=on_token)
 
-        return f"{format_text('cyan', bold=True)}Answer:{reset_format}\n{answer}"
+        return "" if on_token is None else answer
 
     def gather_additional_data(self, user_input: str) -> dict:
         additional_data = {}
@@ -432,16 +2284,96 @@ class AITerminalAssistant:
         if any(keyword in user_input.lower() for keyword in file_keywords):
             words = user_input.split()
             for word in words:
-                if os.path.isfile(word):
-                    with open(word, 'r') as file:
-                        file_content = file.read()
-                    additional_data["file_content"] = file_content
+                path = os.path.join(self.current_directory, os.path.expanduser(word))
+                if os.path.isfile(path):
+                    additional_data["file_content"] = self.data_gatherer.get_file_content(path, user_input)
                     additional_data["target_file"] = word
                     break
         
         return additional_data
 
-    def debug_error(self, command: str, error_output: str, exit_code: int) -> str:
+    def merge_code(self, file_path: str, feedback: str) -> str:
+        self.ensure_system_context()
+        with open(file_path, 'r', errors='replace') as file:
+            code = file.read()
+
+        if estimate_tokens(code) <= self.merge_chunk_tokens:
+            output = self.call(self.merger, f"""
+            Existing script ({file_path}):
+            {code}
+
+            Feedback:
+            {feedback}
+            """, stateless=True)
+            if output.startswith("Error in"):
+                raise RuntimeError(output)
+            return self.strip_code_fence(output) + "\n"
+
+        # Too large for one prompt: map the feedback over pieces of the file
+        # concurrently, then reduce by joining the updated pieces in order.
+        chunks = self.data_gatherer.file_ingestor.split_chunks(code, self.merge_chunk_tokens)
+
+        async def merge_chunk(number, chunk, slots):
+            async with slots:
+                output = await self.merger.acall(f"""
+            This is part {number} of {len(chunks)} of the script {file_path}.
+            Apply only the feedback that concerns this part. If none of it does, return the part unchanged.
+            Return only the code for this part.
+
+            Part {number}:
+            {chunk}
+
+            Feedback:
+            {feedback}
+            """, stateless=True)
+            # An error string in place of a part would end up in the file.
+            if output.startswith("Error in"):
+                raise RuntimeError(f"part {number} of {len(chunks)}: {output}")
+            return self.strip_code_fence(output)
+
+        async def merge_all():
+            import asyncio
+            slots = asyncio.Semaphore(4)
+            return await asyncio.gather(*(merge_chunk(number, chunk, slots)
+                                          for number, chunk in enumerate(chunks, 1)))
+
+        merged = get_async_core().run(merge_all())
+        return "\n".join(part.rstrip("\n") for part in merged) + "\n"
+
+    def merge_file(self, user_input: str) -> str:
+        # :merge FILE FEEDBACK - shows the merger's changes as a diff and
+        # writes them back only if confirmed.
+        words = user_input.split(maxsplit=2)
+        if len(words) < 3:
+            return "Usage: :merge FILE FEEDBACK"
+        file_path = os.path.join(self.current_directory, os.path.expanduser(words[1]))
+        try:
+            with open(file_path, 'r', errors='replace') as file:
+                original = file.read()
+            merged = self.merge_code(file_path, words[2])
+        except (OSError, RuntimeError) as e:
+            return f"{format_text('red')}Merge failed: {e}{reset_format()}"
+        return review_merge(words[1], file_path, original, merged)
+
+    @staticmethod
+    def strip_code_fence(text: str) -> str:
+        lines = text.strip("\n").split("\n")
+        if lines and lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].startswith("```"):
+            lines = lines[:-1]
+        return "\n".join(lines)
+
+    def error_context(self, error_output: str, token_budget: int = None) -> str:
+        started = time.perf_counter()
+        compressed = self.error_compressor.compress(error_output, token_budget)
+        raw_tokens, tokens = estimate_tokens(error_output), estimate_tokens(compressed)
+        self.telemetry.record("Assistant", "error_context", (time.perf_counter() - started) * 1000,
+                              raw_tokens=raw_tokens, tokens=tokens, ratio=round(raw_tokens / max(1, tokens), 2))
+        return compressed
+
+    def debug_prompt(self, command: str, error_output: str, exit_code: int) -> str:
+        error_output = self.error_context(error_output)
         context = f"""
         Command History (last 10 commands):
         {', '.join(self.command_history)}
@@ -459,12 +2391,92 @@ class AITerminalAssistant:
 
         {context}
         """
-
-        return self.debugger(debug_input)
-
-    def handle_error(self, error: str, user_input: str, command: str) -> str:
-        error_analysis = self.error_handler(f"""
-        Error: {error}
+        return debug_input
+
+    def debug_error(self, command: str, error_output: str, exit_code: int, render: bool = True, on_token=None) -> str:
+        debug_input = self.debug_prompt(command, error_output, exit_code)
+        if render and on_token is None:
+            print(f"\n{format_text('yellow', bold=True)}Debugging Suggestion:{reset_format()}")
+        return get_async_core().run(self.adebug_error(debug_input, render=render, on_token=on_token))
+
+    async def adebug_error(self, debug_input: str, render: bool = False, on_token=None) -> str:
+        import asyncio
+        await asyncio.to_thread(self.ensure_system_context)
+        started = time.perf_counter()
+        suggestion = await self.debugger.acall(debug_input, render=render, on_token=on_token)
+        self.telemetry.record(self.debugger.name, "round_trip", (time.perf_counter() - started) * 1000)
+        return suggestion
+
+    def debug_in_background(self, command: str, error_output: str, exit_code: int, announce: bool = True):
+        # The prompt comes back straight away; the suggestion is printed before
+        # a later prompt once it is ready, or on :debug. A newer failure
+        # supersedes an analysis that is still running.
+        if self.pending_debug is not None:
+            self.pending_debug[1].cancel()
+        debug_input = self.debug_prompt(command, error_output, exit_code)
+        self.pending_debug = (command, get_async_core().submit(self.adebug_error(debug_input)))
+        if announce:
+            print(f"{format_text('yellow')}Looking into the error in the background; "
+                  f"type :debug to wait for the suggestion.{reset_format()}")
+
+    def debug_suggestion(self, block: bool = False) -> str:
+        # The pending suggestion, formatted for printing, or "" if there is
+        # none yet. Ctrl-C while waiting stops the analysis.
+        if self.pending_debug is None:
+            return ""
+        command, future = self.pending_debug
+        if not block and not future.done():
+            return ""
+        try:
+            while not future.done():
+                wait([future], timeout=0.1)
+            suggestion = future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            self.pending_debug = None
+            raise
+        except CancelledError:
+            suggestion = None
+        except Exception as e:
+            suggestion = f"Error in processing: {str(e)}"
+        self.pending_debug = None
+        if not suggestion:
+            return ""
+        return f"{format_text('yellow', bold=True)}Debugging Suggestion for '{command}':{reset_format()}\n{suggestion}"
+
+    def stats_report(self) -> str:
+        cache = self.translation_cache.stats()
+        classifier = self.shell_classifier
+        lines = [
+            self.telemetry.report(),
+            "",
+            f"Translation cache: {cache['hits']} hits, {cache['misses']} misses, {cache['entries']} entries",
+            f"Shell fast path: {classifier.fast_path_hits} of {classifier.checked} inputs",
+        ]
+        with self.telemetry.lock:
+            compressions = list(self.telemetry.spans.get(("Assistant", "error_context"), []))
+        if compressions:
+            raw_tokens = sum(span["raw_tokens"] for span in compressions)
+            tokens = sum(span["tokens"] for span in compressions)
+            lines.append(f"Error context: {len(compressions)} compressed, {raw_tokens} -> {tokens} tokens "
+                         f"({raw_tokens / max(1, tokens):.1f}x)")
+        for node in self.nodes():
+            lines.append(f"{node.name} ({node.model_name}): context {node.context.tokens}/{node.context.budget} tokens, "
+                         f"last prompt {node.last_prompt_tokens} tokens")
+        for pool in self.router.pools.values():
+            for endpoint in pool.status():
+                state = "up" if endpoint["healthy"] else "down"
+                lines.append(f"Endpoint {endpoint['url']}: {state}, {endpoint['outstanding']} in flight, "
+                             f"{endpoint['served']} served, {endpoint['failures']} failures")
+        lines.append(f"Spans are written to {self.telemetry.path}")
+        return "\n".join(lines)
+
+    def handle_error(self, error: str, user_input: str, command: str, depth: int = 0) -> str:
+        if depth >= self.max_error_retries:
+            return f"{format_text('red', bold=True)}Error occurred: {error} (giving up after {depth} corrections){reset_format()}"
+        self.ensure_system_context()
+        error_analysis = self.call(self.error_handler, f"""
+        Error: {self.error_context(error, 256)}
         User Input: {user_input}
         Interpreted Command: {command}
         Current Directory: {self.current_directory}
@@ -479,17 +2491,195 @@ class AITerminalAssistant:
         
         confirmation = input(f"Would you like to execute the suggested command? (y/n) ")
         if confirmation.lower() == 'y':
-            return self.execute_command(error_analysis)
+            return self.execute_command(error_analysis, depth + 1)
         
         return f"{format_text('red', bold=True)}Command execution aborted.{reset_format()}"
 
-def setup_readline():
+class AssistantDaemon:
+    # Keeps one warm assistant (profile, catalogue, caches, backend connections)
+    # behind a Unix socket for client.py. Every connection is its own session.
+    # Requests and replies are JSON lines; streamed text arrives as
+    # {"token": ...} lines before the final {"result": ...} or {"error": ...}.
+    def __init__(self, assistant: AITerminalAssistant, path: str = DAEMON_SOCKET):
+        self.assistant = assistant
+        self.path = path
+        self.sessions = 0
+        self.server = None
+
+    def serve(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            if self.running():
+                raise RuntimeError(f"a daemon is already listening on {self.path}")
+            os.unlink(self.path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon.sessions += 1
+                try:
+                    daemon.handle_session(self.rfile, self.wfile)
+                finally:
+                    daemon.sessions -= 1
+
+        previous_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        finally:
+            os.umask(previous_umask)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def running(self) -> bool:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+                return True
+            except OSError:
+                return False
+
+    def handle_session(self, rfile, wfile):
+        session = None
+
+        def send(body: dict):
+            wfile.write((json.dumps(body) + "\n").encode())
+            wfile.flush()
+
+        try:
+            for line in rfile:
+                try:
+                    request = json.loads(line)
+                    if session is None:
+                        session = self.assistant.new_session(request.get("cwd"))
+                    send({"result": self.dispatch(session, request, lambda token: send({"token": token}))})
+                except (BrokenPipeError, ConnectionResetError):
+                    raise
+                except Exception as e:
+                    send({"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def dispatch(self, session: AITerminalAssistant, request: dict, on_token):
+        op = request.get("op")
+        if request.get("cwd"):
+            session.current_directory = request["cwd"]
+        if "path" in request:
+            session.search_path = request["path"]
+        if op == "ping":
+            return {"pid": os.getpid(), "sessions": self.sessions}
+        if op == "translate":
+            return session.batch_translate(request["input"], stateless=False)
+        if op == "report":
+            return self.report(session, request, on_token)
+        if op == "answer":
+            return session.answer_question(request["input"], on_token=on_token)
+        if op == "merge":
+            return session.merge_code(os.path.join(session.current_directory, os.path.expanduser(request["file"])),
+                                      request["feedback"])
+        if op == "stats":
+            return session.stats_report()
+        if op == "debug":
+            suggestion = session.debug_suggestion(block=request.get("wait", False))
+            return {"suggestion": suggestion, "pending": session.pending_debug is not None}
+        if op == "shutdown":
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return "stopping"
+        raise ValueError(f"unknown op: {op}")
+
+    @staticmethod
+    def report(session: AITerminalAssistant, request: dict, on_token) -> str:
+        # The client ran the command in its own tty; record the outcome and
+        # stream a debugging suggestion back if it failed, or with
+        # "background" set, leave it for a later "debug" request.
+        command, exit_code = request["command"], request["exit_code"]
+        session.command_history.append(command)
+        if len(session.command_history) > 10:
+            session.command_history.pop(0)
+        session.history_store.record(request.get("input", command), command, exit_code, request.get("run_ms"),
+                                     session.current_directory, request.get("source", "direct"))
+        if exit_code == 0 and request.get("source") == "model" and request.get("cache_key"):
+            session.translation_cache.put(request["cache_key"], session.cacheable(request), session.current_directory)
+        if exit_code != 0 and request.get("background"):
+            session.debug_in_background(command, request.get("stderr", ""), exit_code, announce=False)
+        elif exit_code != 0:
+            return session.debug_error(command, request.get("stderr", ""), exit_code, on_token=on_token)
+        return ""
+
+class CompletionEngine:
+    # Tab completion for readline. Matches are computed once per prefix and
+    # later `state` calls are served from that list. Directory listings are
+    # cached until the directory's mtime changes, and command names come from
+    # the cached PATH index.
+    max_cached_dirs = 256
+
+    def __init__(self, system_profile: SystemProfile = None):
+        self.system_profile = system_profile or SystemProfile()
+        self.dir_cache = {}
+        self.commands = None
+        self.last_key = None
+        self.matches = []
+
+    def listdir(self, directory: str) -> List[str]:
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return []
+        cached = self.dir_cache.get(directory)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            names = []
+        if directory not in self.dir_cache and len(self.dir_cache) >= self.max_cached_dirs:
+            del self.dir_cache[next(iter(self.dir_cache))]
+        self.dir_cache[directory] = (mtime, names)
+        return names
+
+    def command_names(self) -> List[str]:
+        if self.commands is None:
+            self.commands = sorted(set(self.system_profile.commands) | SHELL_BUILTINS)
+        return self.commands
+
+    @staticmethod
+    def prefixed(names: List[str], prefix: str) -> List[str]:
+        start = bisect.bisect_left(names, prefix)
+        end = start
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return names[start:end]
+
+    def path_matches(self, text: str) -> List[str]:
+        expanded = os.path.expanduser(text)
+        directory, prefix = os.path.split(expanded)
+        names = self.prefixed(self.listdir(directory or '.'), prefix)
+        if not prefix.startswith('.'):
+            # Like a shell glob, hidden files only match an explicit leading dot.
+            names = [name for name in names if not name.startswith('.')]
+        return [os.path.join(directory, name) for name in names]
+
+    def compute(self, text: str, first_word: bool) -> List[str]:
+        if first_word and text and '/' not in text and not text.startswith(('~', '.')):
+            return self.prefixed(self.command_names(), text) + self.path_matches(text)
+        return self.path_matches(text)
+
+    def complete(self, text: str, state: int):
+        line = readline.get_line_buffer()
+        first_word = not line[:readline.get_begidx()].strip()
+        key = (text, first_word, line)
+        if state == 0 or key != self.last_key:
+            self.last_key = key
+            self.matches = self.compute(text, first_word)
+        return self.matches[state] if state < len(self.matches) else None
+
+def setup_readline(system_profile: SystemProfile = None):
     readline.parse_and_bind('tab: complete')
-    
-    def complete(text, state):
-        return (glob.glob(os.path.expanduser(text) + '*') + [None])[state]
-    
-    readline.set_completer(complete)
+    readline.set_completer(CompletionEngine(system_profile).complete)
     readline.set_completer_delims(' \t\n;')
 
 def get_terminal_size():
@@ -499,10 +2689,59 @@ def get_terminal_size():
         columns, rows = os.get_terminal_size(1)
     return columns, rows
 
+def measure_startup() -> float:
+    # Milliseconds from module load until the REPL is ready for input.
+    return (time.perf_counter() - STARTUP_STARTED) * 1000
+
 def main():
+    parser = argparse.ArgumentParser(description="AI-powered terminal assistant")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="print the time to reach the prompt and exit non-zero if it is over budget")
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS,
+                        help=f"startup budget in milliseconds (default: {STARTUP_BUDGET_MS})")
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="do not preload the models and prompt prefixes in the background at startup")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="translate and run one task per line from FILE ('-' for stdin), printing JSON lines")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent translations in batch mode (default: 4)")
+    parser.add_argument('--dry-run', action='store_true', help="in batch mode, only print the translated commands")
+    parser.add_argument('--yes', action='store_true', help="in batch mode, also run commands flagged as destructive")
+    parser.add_argument('--candidates', type=int, default=None,
+                        help="sample this many translations concurrently and run the first that passes local checks")
+    parser.add_argument('--daemon', action='store_true',
+                        help=f"serve client.py sessions on a Unix socket (default: {DAEMON_SOCKET})")
+    args = parser.parse_args()
+
     assistant = AITerminalAssistant()
-    setup_readline()
-    
+    if args.candidates:
+        assistant.command_candidates = args.candidates
+    if not args.no_warm_up and not args.startup_time:
+        assistant.warm_up()
+
+    if args.daemon:
+        try:
+            AssistantDaemon(assistant).serve()
+        except RuntimeError as e:
+            print(f"{format_text('red')}{e}{reset_format()}", file=sys.stderr)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.batch:
+        lines = sys.stdin if args.batch == '-' else open(args.batch, 'r')
+        with lines:
+            failures = assistant.run_batch(lines, workers=max(1, args.workers), dry_run=args.dry_run,
+                                           assume_yes=args.yes)
+        sys.exit(1 if failures else 0)
+
+    setup_readline(assistant.system_profile)
+
+    if args.startup_time:
+        elapsed = measure_startup()
+        print(f"startup: {elapsed:.1f} ms (budget {args.startup_budget:.0f} ms)")
+        sys.exit(0 if elapsed <= args.startup_budget else 1)
+
     print(f"{format_text('green', bold=True)}Welcome to the Enhanced AI-Powered Terminal Assistant!")
     print("This assistant interacts with your real file system and can gather additional data. Use with caution.")
     print("You can use natural language queries or standard shell commands.")
@@ -512,6 +2751,10 @@ def main():
 
     while True:
         try:
+            suggestion = assistant.debug_suggestion()
+            if suggestion:
+                print(suggestion)
+
             columns, _ = get_terminal_size()
             prompt = f"{format_text('green', bold=True)}{os.getcwd()}$ {reset_format()}"
             user_input = input(prompt)
@@ -523,7 +2766,8 @@ def main():
                 break
 
             result = assistant.execute_command(user_input)
-            print(result)
+            if result:
+                print(result)
 
         except KeyboardInterrupt:
             print("\nKeyboardInterrupt")
@@ -0,0 +1,60 @@
+import os
+import shlex
+
+# Used by both main.py and client.py. Only cheap standard-library imports
+# belong here: the client imports this on every start.
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'terminal-assistant')
+DAEMON_SOCKET = os.environ.get('TERMINAL_ASSISTANT_SOCKET') or os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or CACHE_DIR, 'terminal-assistant.sock')
+
+def format_text(fg, bg=None, inverted=False, bold=False):
+    reset = "\033[0m"
+    result = reset
+    if bold:
+        result += "\033[1m"
+    if inverted:
+        result += "\033[7m"
+    fg_codes = {'black': '30', 'red': '31', 'green': '32', 'yellow': '33',
+                'blue': '34', 'magenta': '35', 'cyan': '36', 'white': '37'}
+    bg_codes = {'black': '40', 'red': '41', 'green': '42', 'yellow': '43',
+                'blue': '44', 'magenta': '45', 'cyan': '46', 'white': '47'}
+    result += f'\033[{fg_codes.get(fg, "37")}m'
+    if bg:
+        result += f'\033[{bg_codes.get(bg, "40")}m'
+    return result
+
+def reset_format():
+    return "\033[0m"
+
+def cd_target(command: str):
+    # The directory for a plain "cd" or "cd DIR", unquoted; None for
+    # anything else (cd in a list, extra arguments), which runs in the shell.
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        return None
+    if words == ['cd']:
+        return "~"
+    if len(words) == 2 and words[0] == 'cd':
+        return words[1]
+    return None
+
+def change_directory(path: str) -> str:
+    os.chdir(os.path.expanduser(os.path.expandvars(path)))
+    return f"Changed directory to {os.getcwd()}"
+
+def review_merge(name: str, path: str, original: str, merged: str) -> str:
+    # Shows a merge result as a diff and writes it to path only if confirmed.
+    import difflib
+    diff = "".join(difflib.unified_diff(original.splitlines(keepends=True), merged.splitlines(keepends=True),
+                                        f"a/{name}", f"b/{name}"))
+    if not diff:
+        return "No changes."
+    print(diff)
+    confirmation = input(f"{format_text('yellow', bold=True)}Write these changes to '{name}'? (y/n) {reset_format()}")
+    if confirmation.lower() != 'y':
+        return f"{format_text('red', bold=True)}Merge discarded.{reset_format()}"
+    with open(path, 'w') as file:
+        file.write(merged)
+    return f"Updated {name}"
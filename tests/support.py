@@ -0,0 +1,34 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Imported by every test module before main, which reads the XDG
+# directories at import time: caches, history and spans written by the
+# tests go to a scratch directory that is removed when the run ends.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="terminal-assistant-test-")
+atexit.register(shutil.rmtree, SCRATCH, True)
+os.environ['XDG_CACHE_HOME'] = os.path.join(SCRATCH, 'cache')
+os.environ['XDG_DATA_HOME'] = os.path.join(SCRATCH, 'data')
+sys.path.insert(0, ROOT)
+
+import main
+from benchmark import FakeOllamaServer
+
+class AssistantTestCase(unittest.TestCase):
+    # An assistant with no user config, talking to its own fake Ollama, and
+    # an empty directory to work in.
+    server_class = FakeOllamaServer
+    server_options = dict(prompt_eval_ms=0, token_rate=1000, answer_tokens=3)
+
+    def setUp(self):
+        self.server = self.server_class(**self.server_options).start()
+        self.assistant = main.AITerminalAssistant(transport=main.OllamaTransport(base_url=self.server.url),
+                                                  config={})
+        self.directory = tempfile.mkdtemp(dir=SCRATCH)
+
+    def tearDown(self):
+        self.server.stop()
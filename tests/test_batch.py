@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import unittest
+
+from support import AssistantTestCase, FakeOllamaServer
+
+class RecordingServer(FakeOllamaServer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = []
+
+    def reply_for(self, prompt: str) -> list:
+        self.prompts.append(prompt)
+        return super().reply_for(prompt)
+
+class BatchTest(AssistantTestCase):
+    server_class = RecordingServer
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.directory, 'sub'))
+        with open(os.path.join(self.directory, 'sub', 'notes.txt'), 'w') as f:
+            f.write("hello\n")
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        super().tearDown()
+
+    def test_tasks_after_cd_are_translated_in_the_new_directory(self):
+        out = io.StringIO()
+        failures = self.assistant.run_batch(["cd sub", "cat ./notes.txt", "list the notes here"], workers=2, out=out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(failures, 0)
+        self.assertEqual(results[1]["stdout"], "hello\n")
+        self.assertEqual(results[2]["source"], "model")
+        self.assertNotIn("cwd", results[2])
+        translations = [prompt for prompt in self.server.prompts if "Interpret and convert user input" in prompt]
+        self.assertIn(f"Current Directory: {os.path.join(self.directory, 'sub')}", translations[-1])
+
+if __name__ == "__main__":
+    unittest.main()
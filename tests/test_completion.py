@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from support import SCRATCH, main
+
+class CompletionEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = main.CompletionEngine(SimpleNamespace(commands=['gcc', 'git', 'gitk', 'grep']))
+        self.directory = tempfile.mkdtemp(dir=SCRATCH)
+        for name in ['git-notes.txt', 'gizmo.py', '.gitignore']:
+            open(os.path.join(self.directory, name), 'w').close()
+        os.mkdir(os.path.join(self.directory, 'src'))
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, self.previous_directory)
+
+    def test_first_word_completes_commands_then_paths(self):
+        self.assertEqual(self.engine.compute("git", True), ['git', 'gitk', 'git-notes.txt'])
+        self.assertEqual(self.engine.compute("gi", False), ['git-notes.txt', 'gizmo.py'])
+
+    def test_hidden_files_need_a_leading_dot(self):
+        self.assertNotIn('.gitignore', self.engine.compute("", False))
+        self.assertEqual(self.engine.compute(".g", False), ['.gitignore'])
+
+    def test_paths_in_other_directories(self):
+        open(os.path.join(self.directory, 'src', 'main.c'), 'w').close()
+        self.assertEqual(self.engine.compute("src/m", True), ['src/main.c'])
+        self.assertEqual(self.engine.compute(self.directory + "/giz", False), [self.directory + "/gizmo.py"])
+
+    def test_listing_is_cached_until_the_directory_changes(self):
+        self.assertEqual(self.engine.compute("new", False), [])
+        with mock.patch.object(main.os, 'listdir', side_effect=AssertionError("listed again")):
+            self.assertEqual(self.engine.compute("gi", False), ['git-notes.txt', 'gizmo.py'])
+        open(os.path.join(self.directory, 'new.txt'), 'w').close()
+        os.utime(self.directory, (0, 12345))
+        self.assertEqual(self.engine.compute("new", False), ['new.txt'])
+
+    def test_cache_is_bounded(self):
+        self.engine.max_cached_dirs = 2
+        for name in ['a', 'b', 'c']:
+            os.mkdir(name)
+            self.engine.listdir(name)
+        self.assertEqual(list(self.engine.dir_cache), ['b', 'c'])
+
+    def test_complete_serves_later_states_from_one_computation(self):
+        with mock.patch.object(main.readline, 'get_line_buffer', return_value="cat gi"), \
+             mock.patch.object(main.readline, 'get_begidx', return_value=4):
+            self.assertEqual(self.engine.complete("gi", 0), 'git-notes.txt')
+            with mock.patch.object(self.engine, 'compute', side_effect=AssertionError("computed again")):
+                self.assertEqual(self.engine.complete("gi", 1), 'gizmo.py')
+                self.assertIsNone(self.engine.complete("gi", 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from support import main
+
+class ContextWindowTest(unittest.TestCase):
+    def test_small_budget_is_kept(self):
+        window = main.ContextWindow(budget=100)
+        for number in range(10):
+            window.append({"role": "user", "content": f"request {number} " + "word " * 30})
+            window.append({"role": "assistant", "content": f"reply {number}"})
+            self.assertLessEqual(window.tokens, 100)
+        self.assertGreater(len(window), 0)
+
+    def test_evicted_turns_are_summarised(self):
+        window = main.ContextWindow(budget=400)
+        for number in range(20):
+            window.append({"role": "user", "content": f"request {number} " + "word " * 30})
+            window.append({"role": "assistant", "content": f"reply {number}"})
+        messages = list(window)
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertIn("reply", messages[0]["content"])
+        self.assertEqual(messages[-1]["content"], "reply 19")
+        self.assertLessEqual(window.tokens, 400)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import stat
+import unittest
+from unittest import mock
+
+import client
+from support import AssistantTestCase, main
+
+class DaemonPathTest(AssistantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.daemon = main.AssistantDaemon(self.assistant)
+        self.bin = os.path.join(self.directory, 'bin')
+        os.makedirs(self.bin)
+        program = os.path.join(self.bin, 'only-on-client-path')
+        with open(program, 'w') as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(program, stat.S_IRWXU)
+
+    def translate(self, session, **fields):
+        request = dict(op="translate", input="only-on-client-path --version", cwd=self.directory, **fields)
+        return self.daemon.dispatch(session, request, None)
+
+    def test_commands_resolve_against_the_client_path(self):
+        session = self.assistant.new_session(self.directory)
+        self.assertEqual(self.translate(session, path=self.bin + os.pathsep + os.defpath)["source"], "fast_path")
+        self.assertEqual(self.translate(session, path=os.defpath)["source"], "model")
+        other = self.assistant.new_session(self.directory)
+        self.assertEqual(self.translate(other)["source"], "model")
+
+class LocalClient:
+    # Stands in for client.DaemonClient, dispatching straight to a daemon session.
+    def __init__(self, daemon: main.AssistantDaemon, cwd: str):
+        self.daemon = daemon
+        self.session = daemon.assistant.new_session(cwd)
+        self.cwd = cwd
+        self.ops = []
+        self.debug_pending = False
+
+    def request(self, op: str, on_token=None, **fields):
+        self.ops.append(op)
+        fields.update(op=op, cwd=self.cwd)
+        return self.daemon.dispatch(self.session, fields, on_token)
+
+class ClientCommandTest(AssistantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = LocalClient(main.AssistantDaemon(self.assistant), self.directory)
+
+    def test_merge_runs_on_the_daemon(self):
+        path = os.path.join(self.directory, 'script.py')
+        with open(path, 'w') as f:
+            f.write("print('a')\n")
+        with mock.patch('builtins.input', return_value='y'), mock.patch('builtins.print'):
+            result = client.execute(self.client, f":merge {path} print b instead")
+        self.assertEqual(self.client.ops, ["merge"])
+        self.assertEqual(result, f"Updated {path}")
+        with open(path) as f:
+            self.assertIn("word0", f.read())
+
+    def test_unknown_commands_are_not_translated(self):
+        self.assertEqual(client.execute(self.client, ":mrege x.py fix it"), "Unknown command: :mrege")
+        self.assertEqual(self.client.ops, [])
+        self.assertEqual(self.assistant.execute_command(":mrege x.py fix it"), "Unknown command: :mrege")
+
+if __name__ == "__main__":
+    unittest.main()
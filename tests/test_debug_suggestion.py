@@ -0,0 +1,20 @@
+import unittest
+
+from support import AssistantTestCase
+
+class DebugSuggestionTest(AssistantTestCase):
+    server_options = dict(prompt_eval_ms=500, token_rate=1000, answer_tokens=5)
+
+    def test_block_waits_for_unfinished_analysis(self):
+        self.assistant.debug_in_background("make", "make: *** No rule to make target 'all'.", 2, announce=False)
+        self.assertFalse(self.assistant.pending_debug[1].done())
+        self.assertEqual(self.assistant.debug_suggestion(), "")
+
+        suggestion = self.assistant.debug_suggestion(block=True)
+        self.assertIn("Debugging Suggestion for 'make'", suggestion)
+        self.assertIn("word0", suggestion)
+        self.assertNotIn("Error in processing", suggestion)
+        self.assertIsNone(self.assistant.pending_debug)
+
+if __name__ == "__main__":
+    unittest.main()
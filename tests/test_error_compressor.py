@@ -0,0 +1,42 @@
+import unittest
+
+from support import main
+
+class ErrorCompressorTest(unittest.TestCase):
+    def setUp(self):
+        self.compressor = main.ErrorCompressor()
+
+    def test_identical_lines_are_counted(self):
+        text = "warning: deprecated\n" * 50 + "done"
+        self.assertEqual(self.compressor.compress(text), "warning: deprecated  [repeated 50 times]\ndone")
+
+    def test_similar_lines_become_one(self):
+        text = "\n".join(f"Compiling /src/module{number}.c line {number}" for number in range(40))
+        self.assertEqual(self.compressor.compress(text), "Compiling /src/module0.c line 0  [+39 similar lines]")
+
+    def test_separate_runs_stay_apart(self):
+        lines = ["retrying in 1s", "connect failed", "retrying in 2s", "connect failed", "retrying in 3s"]
+        self.assertEqual(self.compressor.compress("\n".join(lines)), "\n".join(lines))
+
+    def test_frequent_shapes_are_summarised(self):
+        lines = []
+        for number in range(20):
+            lines += [f"step {number} of 20", "---"]
+        compressed = self.compressor.compress("\n".join(lines)).splitlines()
+        self.assertEqual(compressed[:3], ["step 0 of 20", "---", "step 1 of 20"])
+        self.assertIn("[17 more lines like: step <n> of <n>]", compressed)
+
+    def test_root_causes_survive_a_small_budget(self):
+        # Letters only, so no two lines share a shape and nothing collapses.
+        noise = ["noise " + "".join(chr(97 + number // 26 ** i % 26) for i in range(3)) + " padding words here"
+                 for number in range(300)]
+        lines = noise[:100] + ["Traceback (most recent call last):", '  File "app.py", line 3', "KeyError: 'user'"]
+        lines += noise[100:]
+        compressed = main.ErrorCompressor(token_budget=200).compress("\n".join(lines))
+        self.assertIn("Traceback (most recent call last):", compressed)
+        self.assertIn("KeyError: 'user'", compressed)
+        self.assertIn("lines omitted", compressed)
+        self.assertLessEqual(main.estimate_tokens(compressed), 230)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from support import SCRATCH, main
+
+class FileIngestorTest(unittest.TestCase):
+    def setUp(self):
+        self.ingestor = main.FileIngestor(token_budget=200, chunk_lines=10)
+        self.lines = [f"line {number:03d} of the log, nothing to see\n" for number in range(1, 101)]
+        self.lines[54] = "line 055 has the needle we are after\n"
+        self.data = "".join(self.lines).encode()
+
+    def write(self, data: bytes) -> str:
+        path = os.path.join(tempfile.mkdtemp(dir=SCRATCH), 'input')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_matching_chunk_comes_with_first_and_last(self):
+        text = self.ingestor.select_chunks(self.data, [b"needle"])
+        self.assertIn("line 055 has the needle", text)
+        self.assertIn("line 001", text)
+        self.assertIn("[... lines 11-50 omitted ...]", text)
+        self.assertLessEqual(main.estimate_tokens(text), 200)
+
+    def test_without_matches_the_ends_are_kept(self):
+        text = self.ingestor.select_chunks(self.data, [b"absent"])
+        self.assertTrue(text.startswith("line 001"))
+        self.assertNotIn("needle", text)
+        self.assertLessEqual(main.estimate_tokens(text), 200)
+
+    def test_small_and_binary_files(self):
+        self.assertEqual(self.ingestor.ingest(self.write(b"short\n")), "short\n")
+        self.assertEqual(self.ingestor.ingest(self.write(b"\x7fELF\0\0\0")),
+                         "[binary file, 7 bytes; content not included]")
+
+    def test_large_files_are_memory_mapped(self):
+        ingestor = main.FileIngestor(token_budget=200, chunk_lines=10, mmap_threshold=1)
+        text = ingestor.ingest(self.write(self.data), "where is the needle?")
+        self.assertEqual(text, self.ingestor.select_chunks(self.data, [b"needle", b"where"]))
+
+    def test_split_chunks_cuts_at_definitions(self):
+        code = "".join(f"def f{number}():\n    return {number}\n\n" for number in range(10))
+        chunks = self.ingestor.split_chunks(code, 20)
+        self.assertEqual("".join(chunks), code)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.startswith("def ") for chunk in chunks))
+
+if __name__ == "__main__":
+    unittest.main()
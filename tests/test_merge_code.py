@@ -0,0 +1,41 @@
+import os
+import unittest
+
+from support import AssistantTestCase
+
+class MergeCodeTest(AssistantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.assistant.merge_chunk_tokens = 20
+        self.path = os.path.join(self.directory, 'script.py')
+        with open(self.path, 'w') as f:
+            f.write("".join(f"def f{i}():\n    return {i} + {i} + {i} + {i}\n\n" for i in range(12)))
+
+    def test_parts_are_merged_in_order(self):
+        merged = self.assistant.merge_code(self.path, "rename nothing")
+        self.assertGreater(merged.count("word0"), 1)
+        self.assertTrue(merged.endswith("\n"))
+
+    def test_failed_part_is_not_merged(self):
+        calls = []
+
+        async def acall(prompt, *args, **kwargs):
+            calls.append(prompt)
+            if len(calls) == 2:
+                return "Error in processing: connection reset"
+            return "def ok():\n    pass"
+
+        self.assistant.merger.acall = acall
+        with self.assertRaises(RuntimeError) as raised:
+            self.assistant.merge_code(self.path, "rename nothing")
+        self.assertIn("connection reset", str(raised.exception))
+
+    def test_small_file_leaves_no_history(self):
+        with open(self.path, 'w') as f:
+            f.write("print('a')\n")
+        self.assistant.merge_chunk_tokens = 3072
+        self.assistant.merge_code(self.path, "print b instead")
+        self.assertEqual(self.assistant.merger.context.messages, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from support import SCRATCH, main
+
+PROGRAMS = ['watch', 'top', 'find', 'free', 'date', 'install', 'sort', 'less', 'ls', 'git', 'apt', 'cat', 'grep']
+
+class ShellClassifierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(dir=SCRATCH)
+        cls.bin = os.path.join(cls.directory, 'bin')
+        os.makedirs(cls.bin)
+        for name in PROGRAMS:
+            path = os.path.join(cls.bin, name)
+            with open(path, 'w') as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(path, stat.S_IRWXU)
+        with open(os.path.join(cls.directory, 'notes.txt'), 'w') as f:
+            f.write("hello\n")
+
+    def setUp(self):
+        self.classifier = main.ShellClassifier()
+        self.classifier.aliases = {}
+
+    def is_shell_command(self, text: str) -> bool:
+        return self.classifier.is_shell_command(text, self.directory, self.bin)
+
+    def test_english_requests_are_not_commands(self):
+        for text in ['watch disk space', 'top processes by memory', 'find big logs', 'free space', 'date tomorrow',
+                     'kill firefox', 'install vim', 'sort numbers numerically', 'less typing', 'git show me the log']:
+            with self.subTest(text=text):
+                self.assertFalse(self.is_shell_command(text))
+
+    def test_commands_are_recognised(self):
+        for text in ['ls', 'ls -la /tmp', 'cat notes.txt', 'kill 1234', 'git status', 'git checkout main',
+                     'apt install vim', 'grep -c hel+o ./notes.txt', 'sort -n notes.txt | less', 'ls && date',
+                     'ls > out.txt 2>&1', 'ls &']:
+            with self.subTest(text=text):
+                self.assertTrue(self.is_shell_command(text))
+
+    def test_destructive_commands(self):
+        for command in ['rm -rf build', '/bin/rm notes.txt', 'FORCE=1 rm x', 'ls; rm x', 'true && rmdir old',
+                        'ls | xargs rm', 'sudo -u root chmod 777 /', 'find . -name "*.o" -delete',
+                        'find . -exec shred {} ;', '(cd /tmp && dd if=/dev/zero of=disk)', 'echo "unbalanced']:
+            with self.subTest(command=command):
+                self.assertTrue(main.ShellClassifier.is_destructive(command))
+
+    def test_harmless_commands(self):
+        for command in ['ls -la', 'grep rm notes.txt', 'echo "rm -rf /"', 'find . -name rm', 'git rm --cached x']:
+            with self.subTest(command=command):
+                self.assertFalse(main.ShellClassifier.is_destructive(command))
+
+    def validate(self, command: str) -> str:
+        return self.classifier.validate(command, self.directory, self.bin)
+
+    def test_valid_commands(self):
+        for command in ['ls -la', 'cat notes.txt', 'CONFIRM: ls', 'grep -c hello notes.txt > out.txt',
+                        'git checkout origin/main', 'date +%Y/%m/%d', 'ls | sort -r', 'find . -name "*.txt"',
+                        'cat ~', 'sudo ls /root']:
+            with self.subTest(command=command):
+                self.assertEqual(self.validate(command), "")
+
+    def test_problems_are_reported(self):
+        for command, problem in [('', "empty command"), ('ls ((', "syntax error"),
+                                 ('nosuchprogram -x', "nosuchprogram: command not found"),
+                                 ('ls | nosuchprogram', "nosuchprogram: command not found"),
+                                 ('cat missing.txt', "missing.txt: no such file or directory"),
+                                 ('ls ./missing/dir', "./missing/dir: no such file or directory"),
+                                 ('sort < missing.txt', "missing.txt: no such file or directory"),
+                                 ('ls > missing/out.txt', "missing/out.txt: no such file or directory"),
+                                 ('./notes.txt', "./notes.txt: not an executable")]:
+            with self.subTest(command=command):
+                self.assertEqual(self.validate(command), problem)
+
+if __name__ == "__main__":
+    unittest.main()
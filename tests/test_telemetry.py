@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from support import SCRATCH, main
+
+class TelemetryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir=SCRATCH), 'spans.jsonl')
+
+    def test_file_is_rotated_while_open(self):
+        telemetry = main.Telemetry(path=self.path, max_file_bytes=1000)
+        for number in range(100):
+            telemetry.record("Node", "call", number)
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertLess(os.path.getsize(self.path), 1200)
+        self.assertLess(os.path.getsize(self.path + ".1"), 1200)
+
+    def test_percentile_is_nearest_rank(self):
+        self.assertEqual(main.percentile([2, 1], 50), 1)
+        self.assertEqual(main.percentile([4, 3, 2, 1], 50), 2)
+        self.assertEqual(main.percentile(range(1, 7), 50), 3)
+        self.assertEqual(main.percentile(range(1, 21), 95), 19)
+        self.assertEqual(main.percentile(range(1, 21), 100), 20)
+        self.assertEqual(main.percentile([5], 0), 5)
+
+if __name__ == "__main__":
+    unittest.main()
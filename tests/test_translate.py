@@ -0,0 +1,76 @@
+import io
+import json
+import socket
+import unittest
+
+from support import AssistantTestCase, FakeOllamaServer, main
+
+class ScriptedServer(FakeOllamaServer):
+    # Answers translation requests with the given commands, one per call, in turn.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.translations = ["true"]
+        self.calls = 0
+
+    def reply_for(self, prompt: str) -> list:
+        if "Interpret and convert user input" not in prompt:
+            return super().reply_for(prompt)
+        with self.lock:
+            self.calls += 1
+            return [self.translations[(self.calls - 1) % len(self.translations)]]
+
+class FailedTranslationTest(AssistantTestCase):
+    def setUp(self):
+        super().setUp()
+        # Nothing listens on a port we just released, so every model call fails.
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        self.assistant = main.AITerminalAssistant(transport=main.OllamaTransport(base_url=url, retries=0), config={})
+        self.ran = []
+        self.assistant.execute_command_with_live_output = lambda command, *args: self.ran.append(command)
+
+    def test_error_is_shown_instead_of_run(self):
+        result = self.assistant.execute_command("list the biggest files here")
+        self.assertIn("Could not translate the request: Error in processing", result)
+        self.assertEqual(self.ran, [])
+        self.assertIsNone(self.assistant.pending_debug)
+
+    def test_batch_task_fails_without_running(self):
+        out = io.StringIO()
+        self.assertEqual(self.assistant.run_batch(["list the biggest files here"], out=out), 1)
+        result = json.loads(out.getvalue())
+        self.assertEqual(result["status"], "error")
+        self.assertNotIn("exit_code", result)
+
+    def test_daemon_replies_with_an_error(self):
+        daemon = main.AssistantDaemon(self.assistant)
+        session = self.assistant.new_session(self.directory)
+        with self.assertRaises(main.TranslationFailed):
+            daemon.dispatch(session, {"op": "translate", "input": "list the biggest files here"}, None)
+
+class CandidatesTest(AssistantTestCase):
+    server_class = ScriptedServer
+
+    def setUp(self):
+        super().setUp()
+        self.assistant.command_candidates = 3
+        self.ran = []
+        self.assistant.execute_command_with_live_output = lambda command, *args: (self.ran.append(command)
+                                                                                   or ("", "", 0))
+
+    def test_invalid_candidates_are_never_run(self):
+        self.server.translations = ["ls ((", "no-such-program-here -l", "cat ./missing.txt"]
+        result = self.assistant.execute_command("list the biggest files here")
+        self.assertIn("no candidate passed the checks", result)
+        self.assertIn("'ls ((' (syntax error)", result)
+        self.assertIn("no-such-program-here: command not found", result)
+        self.assertEqual(self.ran, [])
+
+    def test_valid_candidate_is_chosen(self):
+        self.server.translations = ["ls ((", "true"]
+        self.assistant.execute_command("list the biggest files here")
+        self.assertEqual(self.ran, ["true"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import SCRATCH, main
+
+class TranslationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(main.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(tempfile.mkdtemp(dir=SCRATCH), 'translations.db')
+
+    def tick(self, seconds: float = 1):
+        self.now += seconds
+
+    def test_entries_expire(self):
+        cache = main.TranslationCache(self.path, ttl=60)
+        cache.put("key", "ls -la")
+        self.tick(59)
+        self.assertEqual(cache.get("key"), "ls -la")
+        self.tick(2)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 0})
+
+    def test_least_recently_used_is_evicted(self):
+        cache = main.TranslationCache(self.path, max_entries=2)
+        cache.put("a", "echo a")
+        self.tick()
+        cache.put("b", "echo b")
+        self.tick()
+        cache.get("a")
+        self.tick()
+        cache.put("c", "echo c")
+        self.assertEqual([cache.get(key) for key in "abc"], ["echo a", None, "echo c"])
+
+    def test_commands_naming_their_directory_are_not_stored(self):
+        cache = main.TranslationCache(self.path)
+        cache.put("a", "ls /home/user/project/src", cwd="/home/user/project")
+        cache.put("b", "ls src", cwd="/home/user/project")
+        cache.put("c", "ls /etc", cwd="/")
+        self.assertEqual([cache.get(key) for key in "abc"], [None, "ls src", "ls /etc"])
+
+    def test_key_only_depends_on_the_directory_when_input_names_a_file_in_it(self):
+        directory = tempfile.mkdtemp(dir=SCRATCH)
+        open(os.path.join(directory, 'notes.txt'), 'w').close()
+        key = main.TranslationCache.make_key
+        self.assertEqual(key("m", "list  Files", directory), key("m", "list files", SCRATCH))
+        self.assertNotEqual(key("m", "show notes.txt", directory), key("m", "show notes.txt", SCRATCH))
+        self.assertNotEqual(key("m", "list files", directory), key("other", "list files", directory))
+
+if __name__ == "__main__":
+    unittest.main()